@@ -1,57 +1,100 @@
 import sys
 import os
+import io
+import re
 import argparse
 import fnmatch
+import heapq
+import contextlib
 import _vs_project_util as vsproj
 import _vs_solution_util as vssol
 import _vs_version_util as vsver
+import _vs_graph_util as vsgraph
+import _vs_write_util as vswrite
+import _vs_profile_util as vsprof
+import _vs_props_util as vsprops
+import _vs_dir_util as vsdir
+# the modules of the cache, watch, plan and state modes are imported where they are used,
+# so a build tool importing this file only pays for what it calls
 
 
 class ChangesData:
     def __init__(self):
         self.changeProjList = list()
         self.changePkgList = list()
+        self.changeProjSet = set()
+        self.changePkgSet = set()
+        self.changeKeys = dict() # project -> (pass, index) at which the propagation changed it
+        self.versions = None # dict() : ProjectRefInfo -> new version of a scenario, None writes ProjectRefInfo.newVersion
 
 
 def getArguments():
     parser = argparse.ArgumentParser()
-    parser.add_argument(dest='solutionFilename', help='Example) Sample.sln')
+    parser.add_argument(dest='solutionFilenames', nargs='*', default=[], metavar='solutionFilename', help='One or more solutions or glob patterns sharing one project model. Example) Sample.sln "apps/**/*.sln"')
     parser.add_argument('--change-packages', '-c', nargs='+', default=[], metavar='"PackageName Version"', dest='changePackageList', help='Example) "DevPlatfomr.Base 1.0.1" "DevPlatfomr.DB 1.0.6"')
     parser.add_argument('--prerelease-signature', '-p', default="", metavar='alpha|beta|rc', dest='prereleaseSignature', help='Example) alpha1')
     parser.add_argument('--assembly-change-packages', '-a', nargs='*', default=[], metavar='PackageName', dest='assemblyChangePackageList', help='Example) DevPlatfomr.Base DevPlatfomr.DB.*')
     parser.add_argument('--assemblyfile-change-packages', '-f', nargs='*', default=[], metavar='PackageName', dest='assemblyFileChangePackageList', help='Example) DevPlatfomr.Base DevPlatfomr.DB.*')
     parser.add_argument('--exclude-packages', '-x', nargs='*', default=[], metavar='PackageName', dest='excludePackageList', help='Example) DevPlatfomr.Base DevPlatfomr.DB.*')
-
-    solutionFilename = parser.parse_args().solutionFilename
-    changePackageList = parser.parse_args().changePackageList
-    prereleaseSignature = parser.parse_args().prereleaseSignature
-    assemblyChangePackageList = parser.parse_args().assemblyChangePackageList
-    assemblyFileChangePackageList = parser.parse_args().assemblyFileChangePackageList
-    excludePackageList = parser.parse_args().excludePackageList
-
-    return solutionFilename, changePackageList, prereleaseSignature, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList
+    parser.add_argument('--jobs', '-j', type=int, default=1, metavar='N', dest='jobs', help='Number of worker processes for project parsing and of threads writing the changed files (0 = all cores)')
+    parser.add_argument('--shard', action='store_true', dest='shard', help='Also run propagation and file updates of unrelated project groups in --jobs worker processes')
+    parser.add_argument('--cache-dir', default=None, metavar='DIR', dest='cacheDir', help='Example) .vsproj-cache')
+    parser.add_argument('--low-memory', action='store_true', dest='lowMemory', help='Do not keep the parsed project files in memory; changed files are read again when they are written')
+    parser.add_argument('--plan-out', default=None, metavar='FILE', dest='planOut', help='Write the computed changes to FILE instead of applying them. Example) plan.json')
+    parser.add_argument('--apply-plan', default=None, metavar='FILE', dest='applyPlan', help='Apply changes saved with --plan-out without analysis. Example) plan.json')
+    parser.add_argument('--impact', nargs='+', default=None, metavar='"PackageName [Version]"', dest='impactPackageList', help='Only list the projects and packages a change of these packages would bump; without a version every user counts. Example) DevPlatfomr.Base "DevPlatfomr.DB 1.0.6"')
+    parser.add_argument('--scenarios', default=None, metavar='FILE', dest='scenarioFile', help='Compare the change sets of a JSON scenario file side by side without writing anything; --jobs runs them in parallel. Example) scenarios.json')
+    parser.add_argument('--changed-files', nargs='+', default=None, metavar='FILE', dest='changedFiles', help='Re-parse only the projects reading these files, "-" reads them from stdin. Needs --state-file. Example) git diff --name-only HEAD~1 | ... --changed-files -')
+    parser.add_argument('--state-file', default=None, metavar='FILE', dest='stateFile', help='Project model saved by the previous run for --changed-files. Example) .vsproj-state')
+    parser.add_argument('--watch', action='store_true', dest='watch', help='Keep the solution loaded and answer JSON requests from stdin')
+    parser.add_argument('--poll-interval', type=float, default=1.0, metavar='SEC', dest='pollInterval', help='File polling interval of --watch')
+    parser.add_argument('--profile', nargs='?', const='text', default=None, choices=['text', 'json'], dest='profileFormat', help='Print per-phase timings and counters to stderr')
+    parser.add_argument('--profile-top', type=int, default=10, metavar='N', dest='profileTop', help='Number of slowest project files in the --profile report')
+    parser.add_argument('--profile-out', default=None, metavar='FILE', dest='profileOut', help='Dump cProfile statistics to FILE. Example) update.prof')
+
+    args = parser.parse_args()
+    args.solutionFilenames = vssol.expandSolutionFilenames(args.solutionFilenames)
+
+    if not args.solutionFilenames and args.applyPlan == None:
+        parser.error("the solution filename is required unless --apply-plan is given")
+    if args.changedFiles != None and args.stateFile == None:
+        parser.error("--changed-files needs --state-file")
+
+    return args
 
 
 def addChangeList(changeData, project):
-    if not (project in changeData.changeProjList):
+    if not (project in changeData.changeProjSet):
+        changeData.changeProjSet.add(project)
         changeData.changeProjList.append(project)
-    if project.packageId and (not (project.packageId in changeData.changePkgList)):
+    if project.packageId and (not (project.packageId in changeData.changePkgSet)):
+        changeData.changePkgSet.add(project.packageId)
         changeData.changePkgList.append(project.packageId)
 
 
-def setNewVersion(refInfo, newVersion):
+def getNewVersion(refInfo, versions = None):
+    # a scenario keeps its versions aside and starts from the files as loaded, the shared model is only read
+    if versions == None: return refInfo.newVersion
+    return versions.get(refInfo)
+
+
+def setNewVersion(refInfo, newVersion, versions = None):
     if (newVersion == None) or not newVersion.core: return False
-    if (refInfo.newVersion != None) and not refInfo.newVersion.core: curVersion = refInfo.newVersion
+    curNewVersion = getNewVersion(refInfo, versions)
+    if (curNewVersion != None) and not curNewVersion.core: curVersion = curNewVersion
     else: curVersion = refInfo.version
+    # a declared range that already accepts the version keeps the reference as it is
+    if refInfo.admits(newVersion): return False
     if vsver.VersionCompare(newVersion, curVersion) > 0:
-        refInfo.newVersion = newVersion.clone()
+        if versions == None: refInfo.newVersion = newVersion.snapshot()
+        else: versions[refInfo] = newVersion.snapshot()
         return True
     else:
         return False
 
 
 def setProjectNewVersion(project, newVersion, changeData):
-    result = setNewVersion(project.projRefInfo, newVersion)
+    result = setNewVersion(project.projRefInfo, newVersion, changeData.versions)
     if result == True:
         addChangeList(changeData, project)
 
@@ -59,13 +102,9 @@ def setProjectNewVersion(project, newVersion, changeData):
 
 
 def incProjectVersion(project, changeData, presig = "" ):
-    if (project.projRefInfo.newVersion == None) or (not project.projRefInfo.newVersion.core):
-        if project.projRefInfo.version != None:
-            newVersion = project.projRefInfo.version.clone()
-            newVersion.incTailVersion(presig)
-        else:
-            newVersion = vsver.SemVersion("1.0.1")
-        return setProjectNewVersion(project, newVersion, changeData)
+    curNewVersion = getNewVersion(project.projRefInfo, changeData.versions)
+    if (curNewVersion == None) or (not curNewVersion.core):
+        return setProjectNewVersion(project, vsver.getNextVersion(project.projRefInfo.version, presig), changeData)
     else:
         return False
 
@@ -76,58 +115,107 @@ def setProjectNewVersionByName(projDict, moduleName, newVersion, changeData):
     return setProjectNewVersion(proj, newVersion, changeData)
 
 
-def analizeProjectList(projList, projDict, changeData, presig = ""):
+@vsprof.timed("analizeProjectList")
+def analizeProjectList(projList, projDict, changeData, presig = "", graph = None):
     if not changeData.changeProjList: return
-
-    while True:
-        changeProjCnt = 0
-
-        for proj in projList:
-            #if proj in changeList: continue
-
-            changeCnt = 0
-            for ref in proj.refPkgs:
-                for prj2 in changeData.changeProjList:
-                    if ref.id == prj2.projRefInfo.id:
-                        if setNewVersion(ref, prj2.projRefInfo.newVersion): changeCnt = changeCnt + 1
-                        break
-            if changeCnt <= 0:
-                for ref in proj.refPrjs:
-                    proj2 = projDict[ref]
-                    if proj2 in changeData.changeProjList: 
-                        changeCnt = changeCnt + 1
-                        break
-            if changeCnt > 0:
-                if incProjectVersion(proj, changeData, presig): changeProjCnt = changeProjCnt + 1
-
-        if changeProjCnt <= 0: break
-
-
-def convertFilterList(changePackageFilterList, changePackageList, projectList):
-    filterList = list()
+    if graph == None: graph = vsgraph.ProjectGraph(projList, projDict)
+
+    # Projects are visited in the same (pass, index) order the old fixed-point loop used,
+    # so the change list and the chosen versions come out identical.
+    firstChangeById = dict()
+    worklist = list()
+    versions = changeData.versions
+
+    def schedule(dep, passNo, index):
+        vsprof.addCount("propagationEdges")
+        depIdx = graph.getIndex(dep)
+        if depIdx < 0: return
+        if depIdx > index: heapq.heappush(worklist, (passNo, depIdx))
+        else: heapq.heappush(worklist, (passNo + 1, depIdx))
+
+    def propagate(proj, passNo, index):
+        refId = proj.projRefInfo.id
+        if not (refId in firstChangeById):
+            firstChangeById[refId] = proj
+            for dep, ref in graph.getPackageDependents(refId):
+                if setNewVersion(ref, getNewVersion(proj.projRefInfo, versions), versions): schedule(dep, passNo, index)
+        for dep in graph.getProjectDependents(proj):
+            schedule(dep, passNo, index)
+
+    for proj in list(changeData.changeProjList):
+        propagate(proj, 1, -1)
+
+    visited = set()
+    while worklist:
+        passNo, idx = heapq.heappop(worklist)
+        if idx in visited: continue
+        visited.add(idx)
+        vsprof.addCount("propagationVisits")
+        vsprof.setMax("propagationPasses", passNo)
+        proj = projList[idx]
+        if incProjectVersion(proj, changeData, presig):
+            changeData.changeKeys[proj] = (passNo, idx)
+            propagate(proj, passNo, idx)
+
+
+def compileFilterList(filterList): # return (set of exact names, one regex for all wildcard patterns or None)
+    # names are compared like fnmatch.fnmatch does, through os.path.normcase
+    exactNames = set()
+    patterns = list()
+    for filter in filterList:
+        filter = os.path.normcase(filter)
+        if any(c in filter for c in "*?["): patterns.append(fnmatch.translate(filter))
+        else: exactNames.add(filter)
+    if not patterns: return exactNames, None
+    return exactNames, re.compile("|".join(patterns))
+
+
+@vsprof.timed("convertFilterList")
+def convertFilterList(changePackageFilterList, changePackageList, projectList): # return set of package names
+    filterSet = set()
+    filters = list()
     for filter in changePackageFilterList:
         if filter == '+' and changePackageList:
             for proj in changePackageList:
-                filterList.append(proj.projRefInfo.id)
+                filterSet.add(proj.projRefInfo.id)
         else:
-            for proj in projectList:
-                name = proj.projRefInfo.id
-                if fnmatch.fnmatch(name, filter): filterList.append(name)
-    return filterList
+            filters.append(filter)
+    if not filters: return filterSet
 
+    exactNames, wildcardRe = compileFilterList(filters)
+    for proj in projectList:
+        name = proj.projRefInfo.id
+        if name == None: continue
+        key = os.path.normcase(name)
+        if key in exactNames or (wildcardRe != None and wildcardRe.match(key)): filterSet.add(name)
+    return filterSet
 
-def applyChangeProjectList(changeList, projDict, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList):
+
+def prepareChangeProjectList(changeList, projDict, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList, writer, propsEdits):
     for proj in changeList:
         if proj.projRefInfo.projectPath == None: continue
-        vsproj.updateProjectInfo(proj, projDict, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList)
+        vsproj.updateProjectInfo(proj, projDict, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList, writer, propsEdits)
 
 
-if __name__ == '__main__':
-    solutionFilename, changePackageList, prereleaseSignature, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList = getArguments()
+@vsprof.timed("applyChangeProjectList")
+def applyChangeProjectList(changeList, projDict, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList, jobs = 1): # return list of the written filenames
+    # every new file content is prepared first, then all files are replaced together
+    writer = vswrite.FileWriteBatch()
+    propsEdits = dict()
+    prepareChangeProjectList(changeList, projDict, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList, writer, propsEdits)
+    vsproj.applyPropsEdits(propsEdits, writer)
+    return writer.commit(jobs)
 
-    solInfo = vssol.getSolutionInfo(solutionFilename)
 
+def computeChangeInfo(solInfo, changePackageList, prereleaseSignature, versions = None): # return ChangesData
+    changeInfo = getInitialChangeInfo(solInfo, changePackageList, versions)
+    analizeProjectList(solInfo.projectList, solInfo.projectDict, changeInfo, prereleaseSignature, solInfo.getProjectGraph())
+    return changeInfo
+
+
+def getInitialChangeInfo(solInfo, changePackageList, versions = None): # return ChangesData with the requested changes only
     changeInfo = ChangesData()
+    changeInfo.versions = versions
     for changeModule in changePackageList:
         changeModuleInfo = changeModule.split(" ")
         moduleName = changeModuleInfo[0]
@@ -139,10 +227,110 @@ if __name__ == '__main__':
             proj = vsproj.ProjectFileInfo()
             proj.projRefInfo.id = moduleName
             proj.projRefInfo.newVersion = newVersion
+            if versions != None: versions[proj.projRefInfo] = newVersion
             addChangeList(changeInfo, proj)
+    return changeInfo
+
 
-    analizeProjectList(solInfo.projectList, solInfo.projectDict, changeInfo, prereleaseSignature)
-        
+def analizeShard(shard): # worker side of computeShardedChangeInfo; return dict of the results of one project group
+    if shard["profile"]: vsprof.enable()
+    projList = shard["projects"]
+    projDict = dict()
+    for proj in projList:
+        if proj.projRefInfo.id != None: projDict[proj.projRefInfo.id] = proj
+        if proj.projRefInfo.projectPath != None: projDict[proj.projRefInfo.projectPath] = proj
+
+    changeInfo = ChangesData()
+    for change in shard["changes"]:
+        if isinstance(change, int): change = projList[change]
+        addChangeList(changeInfo, change)
+    analizeProjectList(projList, projDict, changeInfo, shard["presig"], vsgraph.ProjectGraph(projList, projDict))
+
+    result = {
+        "versions": [(proj.projRefInfo.newVersion, [ref.newVersion for ref in proj.refPkgs]) for proj in projList],
+        "changeKeys": [changeInfo.changeKeys[proj] for proj in changeInfo.changeProjList if proj in changeInfo.changeKeys],
+        "writes": None,
+        "props": None
+    }
+    if shard["filters"] != None:
+        # a group holds every project sharing an id with its members, so local filters give the global answer
+        filters = [convertFilterList(f, changeInfo.changeProjList, projList) for f in shard["filters"]]
+        writer = vswrite.FileWriteBatch()
+        propsEdits = dict()
+        prepareChangeProjectList(changeInfo.changeProjList, projDict, filters[0], filters[1], filters[2], writer, propsEdits)
+        result["writes"] = [(filename, writer.files[filename][0], writer.files[filename][1]) for filename in writer.order]
+        result["props"] = propsEdits
+    if shard["profile"]: result["profile"] = vsprof.disable()
+    return result
+
+
+def makeShards(components, jobs): # return list of sorted index lists, components spread over at most jobs shards
+    shards = [list() for i in range(min(jobs, len(components)))]
+    for component in sorted(components, key=len, reverse=True):
+        min(shards, key=len).extend(component)
+    return [sorted(shard) for shard in shards if shard]
+
+
+def computeShardedChangeInfo(solInfo, changePackageList, prereleaseSignature, jobs, filterLists = None): # return (ChangesData, FileWriteBatch or None)
+    # Independent project groups are analized in worker processes; the changes are merged back in the
+    # (pass, index) order of analizeProjectList, so the result matches computeChangeInfo.
+    changeInfo = getInitialChangeInfo(solInfo, changePackageList)
+    projList = solInfo.projectList
+    graph = solInfo.getProjectGraph()
+    if jobs == None or jobs <= 0: jobs = os.cpu_count() or 1
+
+    changes = list() # index of a project in projList, or a package outside the solution
+    touched = set()
+    for proj in changeInfo.changeProjList:
+        idx = graph.getIndex(proj)
+        if idx >= 0:
+            changes.append(idx)
+            touched.add(idx)
+        else:
+            changes.append(proj)
+            for dep, ref in graph.getPackageDependents(proj.projRefInfo.id): touched.add(graph.getIndex(dep))
+    components = [component for component in graph.getComponents() if not touched.isdisjoint(component)]
+    shards = makeShards(components, jobs)
+    # a single shard runs in this process and reports to the profiler already running here
+    profileShards = vsprof.isEnabled() and len(shards) > 1
+
+    requests = list()
+    for shard in shards:
+        localIdx = dict((idx, i) for i, idx in enumerate(shard))
+        shardChanges = [localIdx[change] if isinstance(change, int) else change for change in changes if not isinstance(change, int) or change in localIdx]
+        requests.append({"projects": [projList[idx] for idx in shard], "changes": shardChanges, "presig": prereleaseSignature, "filters": filterLists, "profile": profileShards})
+
+    if len(requests) <= 1:
+        results = [analizeShard(request) for request in requests]
+    else:
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(max_workers=len(requests)) as executor:
+            results = list(executor.map(analizeShard, requests))
+
+    writer = None
+    propsEdits = dict()
+    if filterLists != None: writer = vswrite.FileWriteBatch()
+    changeKeys = list()
+    for shard, result in zip(shards, results):
+        if "profile" in result: vsprof.profiler.merge(result["profile"])
+        for idx, (newVersion, refVersions) in zip(shard, result["versions"]):
+            proj = projList[idx]
+            proj.projRefInfo.newVersion = newVersion
+            for ref, refVersion in zip(proj.refPkgs, refVersions): ref.newVersion = refVersion
+        for passNo, localIdx in result["changeKeys"]:
+            changeKeys.append((passNo, shard[localIdx]))
+        if writer != None:
+            for filename, data, original in result["writes"]: writer.add(filename, data, original)
+            for propsPath, pkgValues in result["props"].items():
+                vsprops.mergePropsEdits(propsEdits, [{"path": propsPath, "packageVersions": pkgValues}])
+    for passNo, idx in sorted(changeKeys):
+        changeInfo.changeKeys[projList[idx]] = (passNo, idx)
+        addChangeList(changeInfo, projList[idx])
+    if writer != None: vsproj.applyPropsEdits(propsEdits, writer)
+    return changeInfo, writer
+
+
+def printChangeReport(solInfo, changeInfo):
     print("---------------------------")
     for projInfo in changeInfo.changeProjList:
         if not projInfo.projRefInfo.projectPath: continue
@@ -156,8 +344,10 @@ if __name__ == '__main__':
             print("   >", pkg.toString())
         print("  * ref projects:")
         for proj0 in projInfo.refPrjs:
-            proj = solInfo.projectDict[proj0].projRefInfo
-            print("   >", proj.toString())
+            # a ProjectReference outside the solution has nothing to report
+            refProj = solInfo.projectDict.get(proj0)
+            if refProj == None: continue
+            print("   >", refProj.projRefInfo.toString())
         print("  * test project :", projInfo.isTestProject)
         print("---------------------------")
 
@@ -166,10 +356,362 @@ if __name__ == '__main__':
         print(pkg)
     print("---------------------------")
 
+
+def getChangeResult(changeInfo): # return dict for machine readable output
+    projects = list()
+    for projInfo in changeInfo.changeProjList:
+        refInfo = projInfo.projRefInfo
+        if not refInfo.projectPath: continue
+        newVersion = getNewVersion(refInfo, changeInfo.versions)
+        if (newVersion == None) or (not newVersion.core): continue
+        projects.append({
+            "id": refInfo.id,
+            "projectPath": refInfo.projectPath,
+            "version": refInfo.version.toString() if refInfo.version != None else None,
+            "newVersion": newVersion.toString()
+        })
+    return {"projects": projects, "packages": list(changeInfo.changePkgList)}
+
+
+def getImpactChanges(impactPackages): # return list of (package id, SemVersion or None) from "PackageName [Version]" strings
+    changes = list()
+    for item in impactPackages:
+        pkgId, _, version = item.strip().partition(" ")
+        changes.append((pkgId, vsver.SemVersion(version.strip()) if version.strip() else None))
+    return changes
+
+
+def getImpact(solInfo, impactPackages, prereleaseSignature = ""): # return dict of the projects and packages a change of impactPackages would bump
+    # answered from the impact index, no ProjectRefInfo is touched
+    projects = list()
+    packages = list()
+    for idx in solInfo.getImpactIndex(prereleaseSignature).getImpact(getImpactChanges(impactPackages)):
+        projInfo = solInfo.projectList[idx]
+        refInfo = projInfo.projRefInfo
+        projects.append({
+            "id": refInfo.id,
+            "projectPath": refInfo.projectPath,
+            "version": refInfo.version.toString() if refInfo.version != None else None
+        })
+        if projInfo.packageId and not (projInfo.packageId in packages): packages.append(projInfo.packageId)
+    return {"projects": projects, "packages": packages}
+
+
+def printImpactReport(solInfo, impactPackages, prereleaseSignature):
+    print("---------------------------")
+    for item in impactPackages:
+        impact = getImpact(solInfo, [item], prereleaseSignature)
+        print("# Impact of", item, ":", len(impact["projects"]), "projects")
+        for project in impact["projects"]:
+            print("  >", project["id"], project["version"], project["projectPath"])
+        print("  * packages:", " ".join(impact["packages"]))
+        print("---------------------------")
+
+
+def readScenarios(scenarioFilename): # return list of scenario dicts; the file holds a list or {"scenarios": [...]}
+    # [{"name": "base", "changePackages": ["DevPlatfomr.Base 1.0.1"], "prereleaseSignature": "beta"}, ...]
+    import json
+    with open(scenarioFilename, "r", encoding="utf-8") as f:
+        scenarios = json.load(f)
+    if isinstance(scenarios, dict): scenarios = scenarios.get("scenarios", [])
+    return scenarios
+
+
+def getScenario(scenario, index): # return scenario dict with every key set
+    return {
+        "name": scenario.get("name") or "#" + str(index + 1),
+        "changePackages": getChangePackageList(scenario.get("changePackages", [])),
+        "prereleaseSignature": scenario.get("prereleaseSignature", "")
+    }
+
+
+scenarioModel = None # SolutionFileInfo read by the scenario workers
+
+
+def initScenarioWorker(solInfo):
+    global scenarioModel
+    scenarioModel = solInfo
+
+
+def evaluateScenario(scenario, solInfo = None): # return change result dict of one scenario
+    # the versions of the scenario live in its own dict, so the shared model is never written
+    if solInfo == None: solInfo = scenarioModel
+    with contextlib.redirect_stdout(io.StringIO()):
+        changeInfo = computeChangeInfo(solInfo, scenario["changePackages"], scenario["prereleaseSignature"], dict())
+    result = getChangeResult(changeInfo)
+    result["name"] = scenario["name"]
+    return result
+
+
+def evaluateScenarios(solInfo, scenarios, jobs = 1): # return list of change result dicts in scenario order
+    scenarios = [getScenario(scenario, i) for i, scenario in enumerate(scenarios)]
+    if jobs == None or jobs <= 0: jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(scenarios))
+    # the graph is built once here and reaches the workers with the model
+    solInfo.getProjectGraph()
+    if jobs <= 1: return [evaluateScenario(scenario, solInfo) for scenario in scenarios]
+
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=initScenarioWorker, initargs=(solInfo,)) as executor:
+        return list(executor.map(evaluateScenario, scenarios))
+
+
+def printScenarioReport(solInfo, scenarios, results):
+    print("---------------------------")
+    for i, scenario in enumerate(scenarios):
+        scenario = getScenario(scenario, i)
+        print("# Scenario", scenario["name"], ":", ", ".join(scenario["changePackages"]), scenario["prereleaseSignature"])
+    print("---------------------------")
+
+    newVersions = [dict((project["projectPath"], project["newVersion"]) for project in result["projects"]) for result in results]
+    table = [["project", "version"] + [result["name"] for result in results]]
+    for projInfo in solInfo.projectList:
+        refInfo = projInfo.projRefInfo
+        if not any(refInfo.projectPath in versions for versions in newVersions): continue
+        version = refInfo.version.toString() if refInfo.version != None else ""
+        table.append([str(refInfo.id), version] + [versions.get(refInfo.projectPath, "-") for versions in newVersions])
+    table.append(["projects bumped", ""] + [str(len(result["projects"])) for result in results])
+    table.append(["packages changed", ""] + [str(len(result["packages"])) for result in results])
+
+    widths = [max(len(row[col]) for row in table) for col in range(len(table[0]))]
+    for row in table:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+    print("---------------------------")
+
+
+def getChangePlan(solInfo, changeInfo, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList): # return plan dict
+    import _vs_plan_util as vsplan
+    assemblyChangePackageList = convertFilterList(assemblyChangePackageList, changeInfo.changeProjList, solInfo.projectList)
+    assemblyFileChangePackageList = convertFilterList(assemblyFileChangePackageList, changeInfo.changeProjList, solInfo.projectList)
+    excludePackageList = convertFilterList(excludePackageList, changeInfo.changeProjList, solInfo.projectList)
+
+    projectEditsList = list()
+    for proj in changeInfo.changeProjList:
+        if proj.projRefInfo.projectPath == None: continue
+        projectEditsList.append(vsproj.getProjectEdits(proj, solInfo.projectDict, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList))
+    return vsplan.makePlan(solInfo.solutionFilePaths, changeInfo.changePkgList, projectEditsList)
+
+
+def applyChangeInfo(solInfo, changeInfo, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList, jobs = 1): # return list of the written filenames
     assemblyChangePackageList = convertFilterList(assemblyChangePackageList, changeInfo.changeProjList, solInfo.projectList)
     assemblyFileChangePackageList = convertFilterList(assemblyFileChangePackageList, changeInfo.changeProjList, solInfo.projectList)
     excludePackageList = convertFilterList(excludePackageList, changeInfo.changeProjList, solInfo.projectList)
 
-    applyChangeProjectList(changeInfo.changeProjList, solInfo.projectDict, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList)
+    return applyChangeProjectList(changeInfo.changeProjList, solInfo.projectDict, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList, jobs)
+
+
+def handleWatchRequest(watcher, request): # return response dict
+    with contextlib.redirect_stdout(sys.stderr):
+        watcher.poll()
+        solInfo = watcher.solInfo
+        solInfo.resetVersionChanges()
+        changeInfo = computeChangeInfo(solInfo, request.get("changePackages", []), request.get("prereleaseSignature", ""))
+        if request.get("apply", False):
+            applyChangeInfo(solInfo, changeInfo, request.get("assemblyChangePackages", []), request.get("assemblyFileChangePackages", []), request.get("excludePackages", []), watcher.jobs)
+            # the applied files are picked up again by the next poll
+            watcher.poll()
+    return getChangeResult(changeInfo)
+
+
+def runWatchMode(watcher, pollInterval = 1.0):
+    # one JSON request per stdin line, one JSON response per stdout line
+    # {"changePackages": ["DevPlatfomr.Base 1.0.1"], "prereleaseSignature": "", "apply": false}
+    # {"command": "impact", "packages": ["DevPlatfomr.Base", "DevPlatfomr.DB 1.0.6"], "prereleaseSignature": ""}
+    # {"command": "reload"} / {"command": "quit"}
+    import json
+    import time
+    import queue
+    import threading
+    requests = queue.Queue()
+
+    def readRequests():
+        for line in sys.stdin:
+            requests.put(line)
+        requests.put(None)
+
+    threading.Thread(target=readRequests, daemon=True).start()
+
+    while True:
+        try:
+            line = requests.get(timeout=pollInterval)
+        except queue.Empty:
+            with contextlib.redirect_stdout(sys.stderr):
+                watcher.poll()
+            continue
+        if line == None: break
+        line = line.strip()
+        if not line: continue
+
+        startTime = time.perf_counter()
+        try:
+            request = json.loads(line)
+            command = request.get("command", "change")
+            if command == "quit": break
+            elif command == "reload":
+                with contextlib.redirect_stdout(sys.stderr):
+                    watcher.load()
+                response = {"projects": [], "packages": []}
+            elif command == "impact":
+                with contextlib.redirect_stdout(sys.stderr):
+                    watcher.poll()
+                response = getImpact(watcher.solInfo, request.get("packages", []), request.get("prereleaseSignature", ""))
+            elif command == "change":
+                response = handleWatchRequest(watcher, request)
+            else:
+                raise ValueError("unknown command: " + str(command))
+            response["ok"] = True
+        except Exception as e:
+            response = {"ok": False, "error": str(e)}
+        response["elapsedMs"] = round((time.perf_counter() - startTime) * 1000, 3)
+        print(json.dumps(response), flush=True)
+
+
+# In-process API for build tools running many version operations against one loaded model.
+# Nothing is printed; the results are returned.
+#   import ApplyUpdateVersion as vsupdate
+#   solInfo = vsupdate.loadSolution(["Sample.sln"], jobs=0)
+#   bumps = vsupdate.computeBumps(solInfo, {"DevPlatfomr.Base": "1.0.1"})
+#   writtenFiles = vsupdate.applyBumps(solInfo, bumps, assemblyChangePackages=["+"])
+#   impact = vsupdate.getImpact(solInfo, ["DevPlatfomr.Base"])
+#   results = vsupdate.evaluateScenarios(solInfo, [{"name": "a", "changePackages": {"DevPlatfomr.Base": "1.0.1"}}], jobs=4)
+
+class BumpResult:
+    #changeInfo = None # ChangesData, its versions dict holds the bumps so that results do not overwrite each other
+    #projects = None # list() : dict of id, projectPath, version, newVersion of each changed project
+    #packages = None # list() : changed package ids
+    def __init__(self, changeInfo):
+        self.changeInfo = changeInfo
+        result = getChangeResult(changeInfo)
+        self.projects = result["projects"]
+        self.packages = result["packages"]
+
+
+def getChangePackageList(changePackages): # return list of "PackageName Version" from such a list or a dict package id -> version
+    if isinstance(changePackages, dict):
+        return [pkgId + " " + str(version) for pkgId, version in changePackages.items()]
+    return list(changePackages)
+
+
+def loadSolution(solutionFilenames, jobs = 1, cacheDir = None, keepDocuments = True): # return SolutionFileInfo; raise OSError when a solution cannot be read
+    if isinstance(solutionFilenames, str): solutionFilenames = [solutionFilenames]
+    solutionFilenames = vssol.expandSolutionFilenames(solutionFilenames)
+    cache = None
+    if cacheDir:
+        import _vs_cache_util as vscache
+        cache = vscache.ParseCache(cacheDir)
+    vsprops.clearCache()
+    vsdir.clearCache()
+    with contextlib.redirect_stdout(io.StringIO()):
+        solInfo = vssol.getWorkspaceInfo(solutionFilenames, jobs, cache, keepDocuments)
+    if solInfo == None: raise PermissionError("cannot read " + ", ".join(solutionFilenames))
+    return solInfo
+
+
+def computeBumps(solInfo, changePackages, prereleaseSignature = ""): # return BumpResult
+    # every call starts from the versions as loaded and keeps its own versions, the shared model is only read
+    with contextlib.redirect_stdout(io.StringIO()):
+        changeInfo = computeChangeInfo(solInfo, getChangePackageList(changePackages), prereleaseSignature, dict())
+    return BumpResult(changeInfo)
+
+
+def applyBumps(solInfo, bumps, assemblyChangePackages = (), assemblyFileChangePackages = (), excludePackages = (), jobs = 1): # return list of the written filenames
+    # raise ValueError when a project of bumps was read again since, its versions no longer match the files
+    import _vs_state_util as vsstate
+    for proj in bumps.changeInfo.changeProjList:
+        projectPath = proj.projRefInfo.projectPath
+        if projectPath != None and solInfo.projectDict.get(projectPath) is not proj:
+            raise ValueError("bumps were computed before " + projectPath + " changed, compute them again")
+    # the file updates read the newVersion fields, they hold the versions of bumps only while writing
+    solInfo.resetVersionChanges()
+    for refInfo, newVersion in bumps.changeInfo.versions.items(): refInfo.newVersion = newVersion
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            writtenFiles = applyChangeInfo(solInfo, bumps.changeInfo, assemblyChangePackages, assemblyFileChangePackages, excludePackages, jobs)
+            # the model follows the written files, so the next computeBumps starts from the new versions
+            vsstate.refreshProjects(solInfo, writtenFiles, jobs)
+    finally:
+        solInfo.resetVersionChanges()
+    return writtenFiles
+
+
+def main(args):
+    if args.applyPlan:
+        import _vs_plan_util as vsplan
+        vsplan.applyPlan(vsplan.readPlan(args.applyPlan), args.jobs)
+        print("All Done.")
+        return
+
+    cache = None
+    if args.cacheDir:
+        import _vs_cache_util as vscache
+        cache = vscache.ParseCache(args.cacheDir)
+
+    if args.watch:
+        import _vs_watch_util as vswatch
+        watcher = vswatch.SolutionWatcher(args.solutionFilenames, args.jobs, cache)
+        with contextlib.redirect_stdout(sys.stderr):
+            watcher.load()
+        runWatchMode(watcher, args.pollInterval)
+        return
+
+    if args.stateFile: import _vs_state_util as vsstate
+    solInfo = None
+    if args.changedFiles != None: solInfo = vsstate.loadSolution(args.stateFile, args.solutionFilenames, vsstate.readChangedFiles(args.changedFiles), args.jobs, not args.lowMemory)
+    if solInfo == None: solInfo = vssol.getWorkspaceInfo(args.solutionFilenames, args.jobs, cache, not args.lowMemory)
+    if solInfo == None: sys.exit(1)
+
+    if args.impactPackageList:
+        printImpactReport(solInfo, args.impactPackageList, args.prereleaseSignature)
+        return
+
+    if args.scenarioFile:
+        scenarios = readScenarios(args.scenarioFile)
+        printScenarioReport(solInfo, scenarios, evaluateScenarios(solInfo, scenarios, args.jobs))
+        return
+
+    writer = None
+    if args.shard:
+        filterLists = None
+        if not args.planOut: filterLists = [args.assemblyChangePackageList, args.assemblyFileChangePackageList, args.excludePackageList]
+        changeInfo, writer = computeShardedChangeInfo(solInfo, args.changePackageList, args.prereleaseSignature, args.jobs, filterLists)
+    else:
+        changeInfo = computeChangeInfo(solInfo, args.changePackageList, args.prereleaseSignature)
+
+    printChangeReport(solInfo, changeInfo)
+
+    if args.planOut:
+        import _vs_plan_util as vsplan
+        vsplan.writePlan(args.planOut, getChangePlan(solInfo, changeInfo, args.assemblyChangePackageList, args.assemblyFileChangePackageList, args.excludePackageList))
+        print("Plan written to", args.planOut)
+        if args.stateFile: vsstate.writeState(args.stateFile, solInfo)
+        return
+
+    if writer != None: writtenFiles = writer.commit(args.jobs)
+    else: writtenFiles = applyChangeInfo(solInfo, changeInfo, args.assemblyChangePackageList, args.assemblyFileChangePackageList, args.excludePackageList, args.jobs)
+
+    if args.stateFile:
+        # the written files are parsed again so that the next run starts from the new versions
+        vsstate.refreshProjects(solInfo, writtenFiles, args.jobs, False)
+        vsstate.writeState(args.stateFile, solInfo)
 
     print("All Done.")
+
+
+if __name__ == '__main__':
+    args = getArguments()
+
+    if args.profileFormat: vsprof.enable()
+    cprof = None
+    if args.profileOut:
+        import cProfile
+        cprof = cProfile.Profile()
+        cprof.enable()
+    try:
+        with vsprof.phase("total"):
+            main(args)
+    finally:
+        if cprof != None:
+            cprof.disable()
+            cprof.dump_stats(args.profileOut)
+        if args.profileFormat:
+            print(vsprof.disable().formatReport(args.profileFormat, args.profileTop), file=sys.stderr)
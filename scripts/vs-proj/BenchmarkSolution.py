@@ -0,0 +1,140 @@
+import sys
+import os
+import io
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import contextlib
+import json
+import _vs_solution_util as vssol
+import _vs_version_util as vsver
+import ApplyUpdateVersion as updver
+
+
+def getArguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', '-n', type=int, nargs='+', default=[10, 100, 1000, 5000], metavar='N', dest='sizes', help='Example) 10 100 1000')
+    parser.add_argument('--fan-out', type=int, default=3, metavar='N', dest='fanOut', help='Maximum references per project')
+    parser.add_argument('--depth', type=int, default=6, metavar='N', dest='depth', help='Number of dependency layers')
+    parser.add_argument('--legacy-ratio', type=float, default=0.3, metavar='R', dest='legacyRatio', help='Ratio of legacy (AssemblyInfo.cs) projects')
+    parser.add_argument('--change-count', type=int, default=3, metavar='N', dest='changeCount', help='Number of bottom layer packages to bump')
+    parser.add_argument('--seed', type=int, default=1, dest='seed')
+    parser.add_argument('--jobs', '-j', type=int, default=1, metavar='N', dest='jobs')
+    parser.add_argument('--work-dir', default=None, metavar='DIR', dest='workDir', help='Keep the generated solutions in this directory')
+    return parser.parse_args()
+
+
+def writeTextFile(filename, text):
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def generateSolution(rootPath, projectCount, fanOut = 3, depth = 6, legacyRatio = 0.3, seed = 1): # return solution filename
+    rnd = random.Random(seed)
+    depth = max(1, min(depth, projectCount))
+    levels = [i * depth // projectCount for i in range(projectCount)]
+    names = ["Bench.Module%d" % i for i in range(projectCount)]
+    slnLines = ["Microsoft Visual Studio Solution File, Format Version 12.00"]
+
+    for i in range(projectCount):
+        projDir = os.path.join(rootPath, "Module%d" % i)
+        os.makedirs(os.path.join(projDir, "Properties"), exist_ok=True)
+        version = "%d.%d.%d" % (rnd.randint(1, 3), rnd.randint(0, 9), rnd.randint(0, 20))
+
+        # only reference lower layers so that the depth is bounded
+        lower = [j for j in range(i) if levels[j] < levels[i]]
+        refs = rnd.sample(lower, min(len(lower), rnd.randint(0, fanOut))) if lower else []
+        items = list()
+        for r in refs:
+            if rnd.random() < 0.7:
+                items.append('    <PackageReference Include="%s" Version="%d.0.0" />' % (names[r], rnd.randint(1, 3)))
+            else:
+                items.append('    <ProjectReference Include="..%sModule%d%sModule%d.csproj" />' % (os.sep, r, os.sep, r))
+        items.append('    <PackageReference Include="Newtonsoft.Json" Version="13.0.1" />')
+
+        if rnd.random() < legacyRatio:
+            writeTextFile(os.path.join(projDir, "Module%d.csproj" % i),
+                '<?xml version="1.0" encoding="utf-8"?>\n'
+                '<Project ToolsVersion="15.0" xmlns="http://schemas.microsoft.com/developer/msbuild/2003">\n'
+                '  <PropertyGroup>\n    <AssemblyName>%s</AssemblyName>\n    <TargetFrameworkVersion>v4.7.2</TargetFrameworkVersion>\n  </PropertyGroup>\n'
+                '  <ItemGroup>\n    <Compile Include="Properties%sAssemblyInfo.cs" />\n  </ItemGroup>\n'
+                '  <ItemGroup>\n%s\n  </ItemGroup>\n</Project>\n' % (names[i], os.sep, "\n".join(items)))
+            writeTextFile(os.path.join(projDir, "Properties", "AssemblyInfo.cs"),
+                'using System.Reflection;\n\n[assembly: AssemblyTitle("%s")]\n[assembly: AssemblyVersion("%s.0")]\n[assembly: AssemblyFileVersion("%s.0")]\n' % (names[i], version, version))
+        else:
+            writeTextFile(os.path.join(projDir, "Module%d.csproj" % i),
+                '<Project Sdk="Microsoft.NET.Sdk">\n'
+                '  <PropertyGroup>\n    <TargetFramework>net6.0</TargetFramework>\n    <AssemblyName>%s</AssemblyName>\n    <Version>%s</Version>\n  </PropertyGroup>\n'
+                '  <ItemGroup>\n%s\n  </ItemGroup>\n</Project>\n' % (names[i], version, "\n".join(items)))
+
+        if rnd.random() < 0.5:
+            deps = "".join('      <dependency id="%s" version="1.0.0" />\n' % names[r] for r in refs)
+            writeTextFile(os.path.join(projDir, "Module.nuspec"),
+                '<?xml version="1.0" encoding="utf-8"?>\n<package>\n  <metadata>\n    <id>%s</id>\n    <version>%s</version>\n'
+                '    <dependencies>\n%s    </dependencies>\n  </metadata>\n</package>\n' % (names[i], version, deps))
+        else:
+            writeTextFile(os.path.join(projDir, "Packageinfo.json"), json.dumps({"package.id": names[i]}))
+
+        slnLines.append('Project("{FAE04EC0-301F-11D3-BF4B-00C04F79EFBC}") = "Module%d", "Module%d%sModule%d.csproj", "{%08X-0000-0000-0000-000000000000}"' % (i, i, os.sep, i, i))
+        slnLines.append("EndProject")
+
+    slnLines.append("Global\nEndGlobal\n")
+    solutionFilename = os.path.join(rootPath, "Bench.sln")
+    writeTextFile(solutionFilename, "\n".join(slnLines))
+    return solutionFilename
+
+
+def runBenchmark(solutionFilename, changeCount = 3, jobs = 1, seed = 1): # return dict of phase -> seconds
+    timings = dict()
+    with contextlib.redirect_stdout(io.StringIO()):
+        t = time.perf_counter()
+        solInfo = vssol.getSolutionInfo(solutionFilename, jobs)
+        timings["getSolutionInfo"] = time.perf_counter() - t
+
+        rnd = random.Random(seed)
+        changeInfo = updver.ChangesData()
+        bottom = [proj for proj in solInfo.projectList if not proj.refPrjs and all(not ref.id.startswith("Bench.") for ref in proj.refPkgs)]
+        for proj in rnd.sample(bottom, min(changeCount, len(bottom))):
+            # above every generated PackageReference version, so the bump always propagates
+            newVersion = vsver.SemVersion("%d.0.0" % (proj.projRefInfo.version.core[0] + 3))
+            updver.setProjectNewVersionByName(solInfo.projectDict, proj.projRefInfo.id, newVersion, changeInfo)
+
+        t = time.perf_counter()
+        updver.analizeProjectList(solInfo.projectList, solInfo.projectDict, changeInfo, "beta")
+        timings["analizeProjectList"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        assemblyChangePackageList = updver.convertFilterList(["+"], changeInfo.changeProjList, solInfo.projectList)
+        assemblyFileChangePackageList = updver.convertFilterList(["Bench.Module1*"], changeInfo.changeProjList, solInfo.projectList)
+        excludePackageList = updver.convertFilterList(["Bench.Module2?"], changeInfo.changeProjList, solInfo.projectList)
+        timings["convertFilterList"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        updver.applyChangeProjectList(changeInfo.changeProjList, solInfo.projectDict, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList)
+        timings["applyChangeProjectList"] = time.perf_counter() - t
+
+    timings["changed"] = len(changeInfo.changeProjList)
+    return timings
+
+
+if __name__ == '__main__':
+    args = getArguments()
+
+    phases = ["getSolutionInfo", "analizeProjectList", "convertFilterList", "applyChangeProjectList"]
+    print("%8s %8s" % ("projects", "changed") + "".join(" %22s" % p for p in phases))
+
+    for size in args.sizes:
+        if args.workDir:
+            rootPath = os.path.join(args.workDir, "bench%d" % size)
+            if os.path.exists(rootPath): shutil.rmtree(rootPath)
+            os.makedirs(rootPath)
+        else:
+            rootPath = tempfile.mkdtemp(prefix="vsproj-bench-")
+        try:
+            solutionFilename = generateSolution(rootPath, size, args.fanOut, args.depth, args.legacyRatio, args.seed)
+            timings = runBenchmark(solutionFilename, args.changeCount, args.jobs, args.seed)
+        finally:
+            if not args.workDir: shutil.rmtree(rootPath, ignore_errors=True)
+        print("%8d %8d" % (size, timings["changed"]) + "".join(" %21.3fs" % timings[p] for p in phases))
@@ -0,0 +1,109 @@
+import sys
+import os
+import hashlib
+import pickle
+import copy
+import _vs_profile_util as vsprof
+
+
+CACHE_FORMAT_VERSION = 9
+
+
+def getFileHash(filename):
+    h = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def getFileStamp(filename): # return (size, mtime_ns, hash) or None when the file does not exist
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns, getFileHash(filename))
+
+
+def getProjectDependFiles(projInfo):
+    projectPath = projInfo.projRefInfo.projectPath
+    projpath = os.path.dirname(projectPath)
+    files = [projectPath, os.path.join(projpath, "Module.nuspec"), os.path.join(projpath, "Packageinfo.json")]
+    if projInfo.asmInfoPath != None: files.append(projInfo.asmInfoPath)
+    # every props path the lookup checked, a missing one is stamped None and invalidates the entry once it appears
+    files.extend(projInfo.propsLookupPaths)
+    return files
+
+
+class ParseCache:
+    #cacheDir = None
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+        os.makedirs(cacheDir, exist_ok=True)
+
+    def getEntryPath(self, projectFilename):
+        key = hashlib.sha1(os.path.abspath(projectFilename).encode("utf-8")).hexdigest()
+        return os.path.join(self.cacheDir, key + ".pickle")
+
+    def isValidStamps(self, stamps):
+        isChanged = False
+        for i, (filename, stamp) in enumerate(stamps):
+            try:
+                st = os.stat(filename)
+            except OSError:
+                if stamp == None: continue
+                return False, False
+            if stamp == None: return False, False
+            size, mtime, hashValue = stamp
+            if st.st_size != size: return False, False
+            if st.st_mtime_ns == mtime: continue
+            # touched but maybe not modified; fall back to the content hash
+            if getFileHash(filename) != hashValue: return False, False
+            stamps[i] = (filename, (size, st.st_mtime_ns, hashValue))
+            isChanged = True
+        return True, isChanged
+
+    def load(self, projectFilename): # return ProjectFileInfo or None
+        entryPath = self.getEntryPath(projectFilename)
+        try:
+            with open(entryPath, "rb") as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        if entry.get("format") != CACHE_FORMAT_VERSION: return None
+        if entry.get("path") != os.path.abspath(projectFilename): return None
+
+        isValid, isChanged = self.isValidStamps(entry["stamps"])
+        if not isValid: return None
+        if isChanged: self.writeEntry(entryPath, entry)
+        return entry["projInfo"]
+
+    def store(self, projInfo):
+        projectPath = projInfo.projRefInfo.projectPath
+        stamps = [(filename, getFileStamp(filename)) for filename in getProjectDependFiles(projInfo)]
+        # the file contents are re-read on demand, there is no need to keep them in the cache
+        projInfo = copy.copy(projInfo)
+        projInfo.releaseDocuments()
+        entry = {"format": CACHE_FORMAT_VERSION, "path": projectPath, "stamps": stamps, "projInfo": projInfo}
+        self.writeEntry(self.getEntryPath(projectPath), entry)
+
+    def writeEntry(self, entryPath, entry):
+        tmpPath = entryPath + ".tmp"
+        try:
+            with open(tmpPath, "wb") as f:
+                pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpPath, entryPath)
+        except OSError:
+            print("> Cannot write cache entry", entryPath)
+
+    def getProjectInfoList(self, projectFilenames, parseFunc):
+        projList = [self.load(filename) for filename in projectFilenames]
+        missIdxs = [i for i, projInfo in enumerate(projList) if projInfo == None]
+        vsprof.addCount("cacheHits", len(projList) - len(missIdxs))
+        vsprof.addCount("cacheMisses", len(missIdxs))
+        if missIdxs:
+            parsed = parseFunc([projectFilenames[i] for i in missIdxs])
+            for i, projInfo in zip(missIdxs, parsed):
+                projList[i] = projInfo
+                self.store(projInfo)
+        return projList
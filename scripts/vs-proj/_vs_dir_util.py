@@ -0,0 +1,73 @@
+import sys
+import os
+import _vs_profile_util as vsprof
+
+
+class DirectoryCache:
+    #listings = None # dict() : directory -> dict() : normcase name -> os.DirEntry, None when the directory cannot be listed
+    #absPaths = None # dict() : (base directory, relative path) -> absolute path
+    def __init__(self):
+        self.listings = dict()
+        self.absPaths = dict()
+
+    def getListing(self, dirname):
+        if dirname in self.listings: return self.listings[dirname]
+        # one scandir answers every later question about the directory, DirEntry keeps the file type
+        try:
+            with os.scandir(dirname or os.curdir) as entries:
+                listing = dict((os.path.normcase(entry.name), entry) for entry in entries)
+        except OSError:
+            listing = None
+        vsprof.addCount("directoriesListed")
+        self.listings[dirname] = listing
+        return listing
+
+    def getEntry(self, path): # return os.DirEntry or None
+        dirname, name = os.path.split(path)
+        listing = self.getListing(dirname)
+        if listing == None: return None
+        return listing.get(os.path.normcase(name))
+
+    def exists(self, path):
+        entry = self.getEntry(path)
+        if entry == None: return False
+        try:
+            return entry.is_file() or entry.is_dir()
+        except OSError:
+            return False
+
+    def isFile(self, path):
+        entry = self.getEntry(path)
+        if entry == None: return False
+        try:
+            return entry.is_file()
+        except OSError:
+            return False
+
+    def getAbsPath(self, basePath, relPath): # return os.path.abspath(os.path.join(basePath, relPath))
+        key = (basePath, relPath)
+        path = self.absPaths.get(key)
+        if path == None:
+            path = os.path.abspath(os.path.join(basePath, relPath))
+            self.absPaths[key] = path
+        return path
+
+
+dirCache = DirectoryCache()
+
+
+def clearCache(): # call when files may have been added or removed since the listings were read
+    global dirCache
+    dirCache = DirectoryCache()
+
+
+def exists(path):
+    return dirCache.exists(path)
+
+
+def isFile(path):
+    return dirCache.isFile(path)
+
+
+def getAbsPath(basePath, relPath):
+    return dirCache.getAbsPath(basePath, relPath)
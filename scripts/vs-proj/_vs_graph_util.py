@@ -0,0 +1,191 @@
+import sys
+import os
+import _vs_version_util as vsver
+
+
+class ProjectGraph:
+    #projIndex = None # dict() : project -> index in projectList
+    #pkgDependents = None # dict() : package id -> list of (project, ProjectRefInfo)
+    #prjDependents = None # dict() : project path -> list of project
+    def __init__(self, projList, projDict):
+        self.projList = projList
+        self.projDict = projDict
+        self.projIndex = dict()
+        self.pkgDependents = dict()
+        self.prjDependents = dict()
+
+        for idx, proj in enumerate(projList):
+            self.projIndex[proj] = idx
+            for ref in proj.refPkgs:
+                self.pkgDependents.setdefault(ref.id, list()).append((proj, ref))
+            for refPath in proj.refPrjs:
+                deps = self.prjDependents.setdefault(refPath, list())
+                if not deps or deps[-1] is not proj: deps.append(proj)
+
+    def getIndex(self, proj):
+        return self.projIndex.get(proj, -1)
+
+    def getPackageDependents(self, pkgId):
+        return self.pkgDependents.get(pkgId, ())
+
+    def getComponents(self): # return list of index lists, one per weakly connected group of projects, in index order
+        # projects sharing an id, a directory (Module.nuspec) or an AssemblyInfo.cs are kept together
+        # so that no file and no propagation state is shared between groups
+        parent = list(range(len(self.projList)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def union(a, b):
+            a = find(a)
+            b = find(b)
+            if a < b: parent[b] = a
+            elif b < a: parent[a] = b
+
+        firstById = dict()
+        firstByFile = dict()
+        for idx, proj in enumerate(self.projList):
+            refId = proj.projRefInfo.id
+            if refId in firstById: union(idx, firstById[refId])
+            else: firstById[refId] = idx
+            files = [proj.asmInfoPath]
+            if proj.projRefInfo.projectPath != None: files.append(os.path.dirname(proj.projRefInfo.projectPath))
+            for filename in files:
+                if filename == None: continue
+                if filename in firstByFile: union(idx, firstByFile[filename])
+                else: firstByFile[filename] = idx
+
+        for pkgId, deps in self.pkgDependents.items():
+            # packages outside the solution do not connect their users
+            if not (pkgId in firstById): continue
+            for dep, ref in deps: union(self.projIndex[dep], firstById[pkgId])
+        for path, deps in self.prjDependents.items():
+            target = self.projIndex.get(self.projDict.get(path), -1)
+            if target < 0: continue
+            for dep in deps: union(self.projIndex[dep], target)
+
+        components = dict()
+        for idx in range(len(self.projList)):
+            components.setdefault(find(idx), list()).append(idx)
+        return list(components.values())
+
+    def getProjectDependents(self, proj):
+        path = proj.projRefInfo.projectPath
+        if path == None: return ()
+        # ProjectReference resolves through projDict, so only the project registered for the path counts
+        if self.projDict.get(path) is not proj: return ()
+        return self.prjDependents.get(path, ())
+
+
+def getStronglyConnected(succs): # return (list of index lists, component of each index); components come sinks first
+    # iterative Tarjan, a deep ProjectReference chain must not hit the recursion limit
+    count = len(succs)
+    order = [-1] * count
+    low = [0] * count
+    compOf = [-1] * count
+    stack = list()
+    components = list()
+    counter = 0
+    for root in range(count):
+        if order[root] >= 0: continue
+        work = [(root, 0)]
+        while work:
+            idx, pos = work.pop()
+            if pos == 0:
+                order[idx] = low[idx] = counter
+                counter += 1
+                stack.append(idx)
+            else:
+                child = succs[idx][pos - 1]
+                if low[child] < low[idx]: low[idx] = low[child]
+            while pos < len(succs[idx]):
+                child = succs[idx][pos]
+                pos += 1
+                if order[child] < 0:
+                    work.append((idx, pos))
+                    work.append((child, 0))
+                    break
+                if compOf[child] < 0 and order[child] < low[idx]: low[idx] = order[child]
+            else:
+                if low[idx] == order[idx]:
+                    members = list()
+                    while True:
+                        member = stack.pop()
+                        compOf[member] = len(components)
+                        members.append(member)
+                        if member == idx: break
+                    components.append(members)
+    return components, compOf
+
+
+def getBitIndexes(bits): # return sorted list of the set bit positions
+    idxs = list()
+    while bits:
+        lowBit = bits & -bits
+        idxs.append(lowBit.bit_length() - 1)
+        bits ^= lowBit
+    return idxs
+
+
+def isUpdated(ref, version): # True when setting the package to version rewrites the PackageReference
+    return vsver.VersionCompare(version, ref.version) > 0 and not ref.admits(version)
+
+
+class ImpactIndex:
+    #graph = None # ProjectGraph
+    #presig = None # prerelease signature of the automatic bumps
+    #reach = None # list() : project index -> bit set of the projects bumped after its automatic bump, itself included
+    #pkgReach = None # dict() : (package id, version) -> bit set, filled on demand
+    def __init__(self, graph, presig = ""):
+        # The edges are the ones analizeProjectList follows. A project reached on the way gets getNextVersion,
+        # so whether it takes the bump and which PackageReference passes it on is known up front.
+        # Projects sharing an id are all followed, a real run only follows the first one changed.
+        self.graph = graph
+        self.presig = presig
+        self.pkgReach = dict()
+        succs = list()
+        bumped = list()
+        for proj in graph.projList:
+            newVersion = vsver.getNextVersion(proj.projRefInfo.version, presig)
+            bumped.append(vsver.VersionCompare(newVersion, proj.projRefInfo.version) > 0)
+            if not bumped[-1]:
+                succs.append(())
+                continue
+            deps = [graph.getIndex(dep) for dep, ref in graph.getPackageDependents(proj.projRefInfo.id) if isUpdated(ref, newVersion)]
+            deps.extend(graph.getIndex(dep) for dep in graph.getProjectDependents(proj))
+            succs.append(deps)
+
+        components, compOf = getStronglyConnected(succs)
+        compReach = list()
+        for comp, members in enumerate(components):
+            bits = 0
+            for idx in members:
+                if bumped[idx]: bits |= 1 << idx
+                for dep in succs[idx]:
+                    if compOf[dep] != comp: bits |= compReach[compOf[dep]]
+            compReach.append(bits)
+        self.reach = [compReach[comp] for comp in compOf]
+
+    def getPackageReach(self, pkgId, version = None): # return bit set of the projects bumped when pkgId is set to version
+        # without a version every user of the package counts as bumped
+        key = (pkgId, version)
+        bits = self.pkgReach.get(key)
+        if bits != None: return bits
+        bits = 0
+        proj = self.graph.projDict.get(pkgId)
+        idx = self.graph.getIndex(proj)
+        if idx >= 0 and (version == None or vsver.VersionCompare(version, proj.projRefInfo.version) > 0):
+            bits = 1 << idx
+            for dep in self.graph.getProjectDependents(proj): bits |= self.reach[self.graph.getIndex(dep)]
+        for dep, ref in self.graph.getPackageDependents(pkgId):
+            if version == None or isUpdated(ref, version): bits |= self.reach[self.graph.getIndex(dep)]
+        self.pkgReach[key] = bits
+        return bits
+
+    def getImpact(self, changes): # changes: list of (package id, SemVersion or None); return sorted list of indexes of the bumped projects
+        bits = 0
+        for pkgId, version in changes: bits |= self.getPackageReach(pkgId, version)
+        return getBitIndexes(bits)
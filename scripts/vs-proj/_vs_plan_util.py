@@ -0,0 +1,58 @@
+import sys
+import os
+import json
+import _vs_project_util as vsproj
+import _vs_write_util as vswrite
+
+
+PLAN_FORMAT_VERSION = 2
+
+
+def makePlan(solutionFilenames, changePkgList, projectEditsList):
+    if isinstance(solutionFilenames, str): solutionFilenames = [solutionFilenames]
+    return {
+        "format": PLAN_FORMAT_VERSION,
+        "solution": solutionFilenames[0],
+        "solutions": list(solutionFilenames),
+        "packages": list(changePkgList),
+        "projects": [edits for edits in projectEditsList if edits != None]
+    }
+
+
+def convertPlanPaths(plan, convert):
+    for edits in plan["projects"]:
+        edits["projectPath"] = convert(edits["projectPath"])
+        if edits["assemblyInfo"] != None: edits["assemblyInfo"]["path"] = convert(edits["assemblyInfo"]["path"])
+        if edits["nuspec"] != None: edits["nuspec"]["path"] = convert(edits["nuspec"]["path"])
+        for propsEdits in edits.get("props") or (): propsEdits["path"] = convert(propsEdits["path"])
+
+
+def writePlan(planFilename, plan):
+    # paths are stored relative to the plan file so that the plan can be applied on another checkout
+    plan = json.loads(json.dumps(plan))
+    basePath = os.path.dirname(os.path.abspath(planFilename))
+    convertPlanPaths(plan, lambda path: os.path.relpath(path, basePath).replace(os.sep, "/"))
+    with open(planFilename, "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2)
+        f.write("\n")
+
+
+def readPlan(planFilename): # return plan dict
+    with open(planFilename, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    # version 1 plans only lack the props edits
+    if not (plan.get("format") in (1, PLAN_FORMAT_VERSION)):
+        raise ValueError("unsupported plan format: " + str(plan.get("format")))
+    basePath = os.path.dirname(os.path.abspath(planFilename))
+    convertPlanPaths(plan, lambda path: os.path.normpath(os.path.join(basePath, path)))
+    return plan
+
+
+def applyPlan(plan, jobs = 1):
+    writer = vswrite.FileWriteBatch()
+    propsEdits = dict()
+    for edits in plan["projects"]:
+        print("Apply", edits["projectPath"], edits["version"], "=>", edits["newVersion"])
+        vsproj.applyProjectEdits(edits, None, writer, propsEdits)
+    vsproj.applyPropsEdits(propsEdits, writer)
+    writer.commit(jobs)
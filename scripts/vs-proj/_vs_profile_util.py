@@ -0,0 +1,124 @@
+import sys
+import time
+import json
+import functools
+import contextlib
+
+
+class Profiler:
+    #phases = None # dict() : phase name -> [call count, seconds]
+    #files = None # list() : (filename, seconds)
+    #counters = None # dict() : counter name -> value
+    #maxCounters = None # set() : names of the counters kept with setMax
+    def __init__(self):
+        self.phases = dict()
+        self.files = list()
+        self.counters = dict()
+        self.maxCounters = set()
+
+    def addPhase(self, name, seconds):
+        entry = self.phases.get(name)
+        if entry == None: self.phases[name] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def addFile(self, filename, seconds):
+        self.files.append((filename, seconds))
+
+    def addCount(self, name, value = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def setMax(self, name, value):
+        self.maxCounters.add(name)
+        if value > self.counters.get(name, 0): self.counters[name] = value
+
+    def merge(self, other):
+        for name, (count, seconds) in other.phases.items():
+            entry = self.phases.setdefault(name, [0, 0.0])
+            entry[0] += count
+            entry[1] += seconds
+        self.files.extend(other.files)
+        for name, value in other.counters.items():
+            if name in other.maxCounters: self.setMax(name, value)
+            else: self.addCount(name, value)
+
+    def getReport(self, top = 10): # return dict
+        slowest = sorted(self.files, key=lambda f: f[1], reverse=True)[:top]
+        return {
+            "phases": dict((name, {"calls": count, "seconds": round(seconds, 6)}) for name, (count, seconds) in self.phases.items()),
+            "slowestFiles": [{"file": filename, "seconds": round(seconds, 6)} for filename, seconds in slowest],
+            "counters": dict(self.counters)
+        }
+
+    def formatReport(self, format = "text", top = 10): # return str
+        report = self.getReport(top)
+        if format == "json": return json.dumps(report, indent=2)
+
+        lines = ["# Profile (wall time, nested phases are inclusive)"]
+        for name, entry in report["phases"].items():
+            lines.append("  %-24s %8d calls %12.3f ms" % (name, entry["calls"], entry["seconds"] * 1000))
+        lines.append("# Slowest files")
+        for entry in report["slowestFiles"]:
+            lines.append("  %12.3f ms  %s" % (entry["seconds"] * 1000, entry["file"]))
+        lines.append("# Counters")
+        for name, value in sorted(report["counters"].items()):
+            lines.append("  %-24s %d" % (name, value))
+        return "\n".join(lines)
+
+
+profiler = None
+
+
+def enable(): # start a new profiler; return it
+    global profiler
+    profiler = Profiler()
+    return profiler
+
+
+def disable(): # stop profiling; return the collected profiler
+    global profiler
+    result = profiler
+    profiler = None
+    return result
+
+
+def isEnabled():
+    return profiler != None
+
+
+def addCount(name, value = 1):
+    if profiler != None: profiler.addCount(name, value)
+
+
+def setMax(name, value):
+    if profiler != None: profiler.setMax(name, value)
+
+
+@contextlib.contextmanager
+def phase(name):
+    if profiler == None:
+        yield
+        return
+    startTime = time.perf_counter()
+    try:
+        yield
+    finally:
+        if profiler != None: profiler.addPhase(name, time.perf_counter() - startTime)
+
+
+def timed(name, perFile = False): # decorator; with perFile the first argument is recorded as the file name
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if profiler == None: return func(*args, **kwargs)
+            startTime = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if profiler != None:
+                    seconds = time.perf_counter() - startTime
+                    profiler.addPhase(name, seconds)
+                    if perFile and args: profiler.addFile(str(args[0]), seconds)
+        return wrapper
+    return decorator
@@ -4,21 +4,41 @@ import re
 import json
 import xml.etree.ElementTree as etree
 import _vs_version_util as vsver
+import _vs_xml_util as vsxml
+import _vs_props_util as vsprops
+import _vs_dir_util as vsdir
+import _vs_profile_util as vsprof
+
+
+NS_TAG_RE = re.compile(r"^\{\s*(.*)\s*\}")
+#[assembly: AssemblyVersion("1.0.2.0")]
+#[assembly: AssemblyFileVersion("1.0.2.0")]
+SDK_PROPERTY_NAMES = ("AssemblyName", "Version", "TargetFramework", "AssemblyVersion", "FileVersion", "GeneratePackageOnBuild", "ManagePackageVersionsCentrally")
+PULL_CHUNK_SIZE = 64 * 1024
+ASSEMBLY_INFO_RE = re.compile(r"^[^\S\n]*\[assembly:[^\S\n]*(?P<attr>AssemblyVersion|AssemblyFileVersion)\([^\S\n]*\"[^\S\n]*(?P<value>.*)\"\)\].*$", re.M)
 
 class ProjectRefInfo:
     #id = None
     #version = None
     #newVersion = None
-    def __init__(self, id, version):
+    #versionRange = None # vsver.VersionRange when the reference declares a range or a floating version
+    __slots__ = ("id", "projectPath", "version", "newVersion", "versionRange")
+
+    def __init__(self, id, version, versionRange = None):
         self.id = id
         self.projectPath = None
         self.version = version
         self.newVersion = None        
+        self.versionRange = versionRange
+
+    def admits(self, version): # True when the declared range already accepts version, nothing needs rewriting
+        return self.versionRange != None and self.versionRange.contains(version)
 
     def toString(self):
         if self.id != None: i = self.id
         else: i = "None"
-        if self.version != None: v = self.version.toString()
+        if self.versionRange != None: v = self.versionRange.text
+        elif self.version != None: v = self.version.toString()
         else: v = "None"
         if self.newVersion != None: 
             return i + " (" + v + " => " + self.newVersion.toString() + ")"
@@ -35,6 +55,10 @@ class ProjectFileInfo:
     #frameworkinfo = None
     #projectPath = None
     #asmInfoPath = None
+    __slots__ = ("projRefInfo", "packageId", "assemblyVersion", "assemblyFileVersion", "refPkgs", "refPrjs", "refPkgDict", "frameworkinfo",
+                 "asmInfoPath", "isTestProject", "projAnchors", "nuspecAnchors", "projData", "nuspecData",
+                 "buildPropsPath", "packagesPropsPath", "propsLookupPaths", "propsRefPaths")
+
     def __init__(self):
         self.projRefInfo = ProjectRefInfo(None, None)
         self.packageId = None
@@ -42,18 +66,222 @@ class ProjectFileInfo:
         self.assemblyFileVersion = None
         self.refPkgs = list()
         self.refPrjs = list()
+        self.refPkgDict = dict() # package id -> first ProjectRefInfo in refPkgs
         self.frameworkinfo = None
         self.asmInfoPath = None
         self.isTestProject = False
+        self.projAnchors = None # byte offsets for patching the .csproj
+        self.nuspecAnchors = None # byte offsets for patching Module.nuspec
+        self.projData = None # .csproj bytes read during the analysis
+        self.nuspecData = None # Module.nuspec bytes read during the analysis
+        self.buildPropsPath = None # Directory.Build.props that applies to the project
+        self.packagesPropsPath = None # Directory.Packages.props that applies to the project
+        self.propsLookupPaths = list() # props paths checked for the project, missing ones included
+        self.propsRefPaths = dict() # package id -> props file holding the version of the reference
+
+    def addRefPkg(self, refInfo):
+        self.refPkgs.append(refInfo)
+        self.refPkgDict.setdefault(refInfo.id, refInfo)
+
+    def addRefPrj(self, refPath):
+        self.refPrjs.append(refPath)
+
+    def releaseDocuments(self):
+        self.projData = None
+        self.nuspecData = None
 
 
-def findRefInfo(refInfoList, refId):
-    if not refInfoList: return None
-    for refInfo in refInfoList:
-        if refInfo.id == refId: return refInfo
+def getNsPath(path, ns):
+    if ns == None: return path
+    return "/".join("vsproj:" + p for p in path.split("/"))
+
+
+def getNamespaces(root):
+    m = NS_TAG_RE.match(root.tag)
+    if m: return {"vsproj": m.group(1)}
     return None
 
-def getProjectInfo(projectFilename): # return ProjectFileInfo
+
+def scanAssemblyInfo(text): # return dict of attribute name -> version string
+    values = dict()
+    for m in ASSEMBLY_INFO_RE.finditer(text):
+        values[m.group("attr")] = m.group("value")
+    return values
+
+
+def rewriteAssemblyInfo(text, values): # values: dict of attribute name -> new version string
+    def replace(m):
+        attr = m.group("attr")
+        if not (attr in values): return m.group(0)
+        return "[assembly: " + attr + "(\"" + values[attr] + "\")]"
+    return ASSEMBLY_INFO_RE.sub(replace, text)
+
+
+def getProjectAnchors(doc, ns):
+    root = doc.root
+    anchors = {"stamp": doc.stamp, "props": dict(), "packageRefs": list()}
+    for tagName in ("Version", "AssemblyVersion", "FileVersion"):
+        node = root.find(getNsPath("PropertyGroup/" + tagName, ns), ns)
+        if node != None: anchors["props"][tagName] = doc.getTextAnchor(node)
+    groupNode = root.find(getNsPath("PropertyGroup", ns), ns)
+    if groupNode != None: anchors["group"] = doc.getChildAnchor(groupNode)
+    else: anchors["group"] = None
+    anchors["root"] = doc.getChildAnchor(root)
+    for pkg in root.findall(getNsPath("ItemGroup/PackageReference", ns), ns):
+        anchor = None
+        if 'Version' in pkg.attrib:
+            anchor = doc.getAttrAnchor(pkg, 'Version')
+        elif 'VersionOverride' in pkg.attrib:
+            anchor = doc.getAttrAnchor(pkg, 'VersionOverride')
+        else:
+            rv = pkg.find(getNsPath("Version", ns), ns)
+            if rv != None: anchor = doc.getTextAnchor(rv)
+        anchors["packageRefs"].append((pkg.attrib['Include'], anchor))
+    return anchors
+
+
+def getNugetAnchors(doc):
+    root = doc.root
+    anchors = {"stamp": doc.stamp, "version": doc.getTextAnchor(root.find("metadata/version")), "deps": list()}
+    deps = root.findall("metadata/dependencies/dependency")
+    deps.extend(root.findall("metadata/dependencies/group/dependency"))
+    for dep in deps:
+        anchors["deps"].append((dep.attrib['id'], doc.getAttrAnchor(dep, 'version'), vsver.parseVersionRange(dep.attrib.get('version'))))
+    return anchors
+
+
+def readSdkProjectValues(data): # return dict of the values getProjectInfo needs, or None when the full tree is required
+    # pull parsing keeps only the element being read; the write path parses the file again when it needs offsets
+    # legacy projects declare the msbuild namespace on the root, skip them before starting a parser
+    rootPos = data.find(b"<Project")
+    if rootPos >= 0 and b"xmlns=" in data[rootPos:data.find(b">", rootPos)]: return None
+
+    props = dict() # property name -> text of the first root/PropertyGroup/<name>
+    pkgRefs = list() # list of (Include, version text)
+    prjRefs = list()
+    parser = etree.XMLPullParser(events=("start", "end"))
+    path = list() # tags from the root down to the current element
+    for pos in range(0, len(data), PULL_CHUNK_SIZE):
+        parser.feed(data[pos:pos + PULL_CHUNK_SIZE])
+        for event, elem in parser.read_events():
+            if event == "start":
+                # namespaced (legacy) projects go through the full tree
+                if not path and elem.tag.startswith("{"): return None
+                path.append(elem.tag)
+                continue
+            path.pop()
+            if len(path) == 1: elem.clear()
+            if len(path) != 2: continue
+            group = path[1]
+            if group == "PropertyGroup":
+                if elem.tag in SDK_PROPERTY_NAMES and not (elem.tag in props): props[elem.tag] = elem.text
+            elif group == "ItemGroup":
+                if elem.tag == "PackageReference":
+                    refver = None
+                    if 'Version' in elem.attrib:
+                        refver = elem.attrib['Version']
+                    elif 'VersionOverride' in elem.attrib:
+                        refver = elem.attrib['VersionOverride']
+                    else:
+                        rv = elem.find('Version')
+                        if rv != None: refver = rv.text
+                    pkgRefs.append((elem.attrib['Include'], refver))
+                elif elem.tag == "ProjectReference":
+                    prjRefs.append(elem.attrib['Include'])
+            elem.clear()
+    parser.close()
+
+    if not ("TargetFramework" in props): return None
+    vsprof.addCount("sdkFastPathFiles")
+    return {"properties": props, "packageReferences": pkgRefs, "projectReferences": prjRefs}
+
+
+def setPropsInfo(projInfo, projpath): # return (Directory.Build.props info, Directory.Packages.props info)
+    buildInfo, packagesInfo = vsprops.getDirectoryProps(projpath)
+    if buildInfo != None: projInfo.buildPropsPath = buildInfo.path
+    if packagesInfo != None: projInfo.packagesPropsPath = packagesInfo.path
+    projInfo.propsLookupPaths = vsprops.getLookupPaths(projpath)
+    return buildInfo, packagesInfo
+
+
+def getInheritedVersion(buildInfo, name, default): # return the version text of the props property or default
+    if buildInfo == None: return default
+    value = buildInfo.getVersion(name)
+    if value == None: return default
+    return value
+
+
+def addPackageReferences(projInfo, pkgRefs, buildInfo, packagesInfo, isCentral): # pkgRefs: list of (Include, version text or None)
+    # Directory.Build.props is imported before the project body, so its items come first
+    refs = list()
+    if buildInfo != None and buildInfo.packageRefs:
+        ownIds = set(include for include, refver in pkgRefs)
+        for include, refver in buildInfo.packageRefs:
+            if not (include in ownIds): refs.append((include, refver, buildInfo.path))
+    for include, refver in pkgRefs:
+        refs.append((include, refver, None))
+
+    for include, refver, propsPath in refs:
+        if not refver:
+            propsPath = None
+            if isCentral and (include in packagesInfo.packageVersions):
+                refver = packagesInfo.packageVersions[include]
+                propsPath = packagesInfo.path
+        if not refver: refver = "1.0.0"
+        if propsPath != None: projInfo.propsRefPaths[include] = propsPath
+        projInfo.addRefPkg(newPackageRefInfo(include, refver))
+
+
+def newPackageRefInfo(include, refver): # a range is kept next to its lowest version, which takes part in the comparisons
+    versionRange = vsver.parseVersionRange(refver)
+    if versionRange == None: return ProjectRefInfo(include, vsver.internVersion(refver))
+    version = versionRange.getBaseVersion()
+    if version == None: version = vsver.internVersion("0.0.0")
+    return ProjectRefInfo(include, version, versionRange)
+
+
+def setSdkProjectInfo(projInfo, values, projectFilename):
+    props = values["properties"]
+    projpath = os.path.dirname(projectFilename)
+    buildInfo, packagesInfo = setPropsInfo(projInfo, projpath)
+    for name in ("Version", "AssemblyVersion", "FileVersion"):
+        if not (name in props):
+            value = getInheritedVersion(buildInfo, name, None)
+            if value != None: props[name] = value
+
+    if "AssemblyName" in props: assemblyName = props["AssemblyName"]
+    else: assemblyName = os.path.splitext(os.path.basename(projectFilename))[0]
+    if "Version" in props: version = vsver.internVersion(props["Version"])
+    else: version = vsver.internVersion("1.0.0")
+    if "AssemblyVersion" in props: assemblyVersion = vsver.internVersion(props["AssemblyVersion"])
+    else: assemblyVersion = vsver.internVersion("1.0.0.0")
+    if "FileVersion" in props: assemblyFileVersion = vsver.internVersion(props["FileVersion"])
+    else: assemblyFileVersion = version
+
+    projInfo.projRefInfo.id = assemblyName
+    projInfo.projRefInfo.version = version
+    projInfo.assemblyVersion = assemblyVersion
+    projInfo.assemblyFileVersion = assemblyFileVersion
+    projInfo.frameworkinfo = props["TargetFramework"]
+
+    isCentral = vsprops.isCentralManaged(buildInfo, packagesInfo, props.get("ManagePackageVersionsCentrally"))
+    addPackageReferences(projInfo, values["packageReferences"], buildInfo, packagesInfo, isCentral)
+    for include in values["projectReferences"]:
+        projInfo.addRefPrj(vsdir.getAbsPath(projpath, include))
+
+
+def readPackageSource(projInfo, projpath, isGeneratePackage):
+    nuspecPath = os.path.join(projpath, "Module.nuspec")
+    if vsdir.exists(nuspecPath):
+        readNugetRefs(projInfo, nuspecPath)
+    elif not isGeneratePackage:
+        pkgInfoPath = os.path.join(projpath, "Packageinfo.json")
+        if vsdir.exists(pkgInfoPath):
+            readPackageInfo(projInfo, pkgInfoPath)
+
+
+@vsprof.timed("getProjectInfo", perFile=True)
+def getProjectInfo(projectFilename, fastPath = True): # return ProjectFileInfo
     projInfo = ProjectFileInfo()
     projInfo.isTestProject = projectFilename.endswith(".Test.csproj") or projectFilename.endswith(".Tests.csproj")
 
@@ -66,14 +294,18 @@ def getProjectInfo(projectFilename): # return ProjectFileInfo
 
     projpath = os.path.dirname(projectFilename)
 
-    doc = etree.parse(projectFilename)
-    root = doc.getroot()    
-    token = re.findall(r"^\{\s*(.*)\s*\}", root.tag)
-    if token: 
-        ns = {"vsproj": token[0]}
-        etree.register_namespace("", token[0])
-    else:
-        ns = None
+    data, stamp = vsxml.readXmlFile(projectFilename)
+    if fastPath:
+        sdkValues = readSdkProjectValues(data)
+        if sdkValues != None:
+            setSdkProjectInfo(projInfo, sdkValues, projectFilename)
+            readPackageSource(projInfo, projpath, "GeneratePackageOnBuild" in sdkValues["properties"])
+            return projInfo
+
+    doc = vsxml.parseXmlBytes(data, stamp)
+    root = doc.root
+    ns = getNamespaces(root)
+    buildInfo, packagesInfo = setPropsInfo(projInfo, projpath)
 
     version = None
     assemblyName = None
@@ -90,8 +322,8 @@ def getProjectInfo(projectFilename): # return ProjectFileInfo
         versionNode = root.find("vsproj:PropertyGroup/vsproj:Version", ns)
     else:
         versionNode = root.find("PropertyGroup/Version")
-    if versionNode != None: version = vsver.SemVersion(versionNode.text)
-    else: version = vsver.SemVersion("1.0.0")
+    if versionNode != None: version = vsver.internVersion(versionNode.text)
+    else: version = vsver.internVersion(getInheritedVersion(buildInfo, "Version", "1.0.0"))
 
     framework = None
     if ns != None:
@@ -101,11 +333,14 @@ def getProjectInfo(projectFilename): # return ProjectFileInfo
     if t != None:
         framework = t.text
         assemVersionNode = root.find("PropertyGroup/AssemblyVersion")
-        if assemVersionNode != None: assemblyVersion = vsver.SemVersion(assemVersionNode.text)
-        else: assemblyVersion = vsver.SemVersion("1.0.0.0")
+        if assemVersionNode != None: assemblyVersion = vsver.internVersion(assemVersionNode.text)
+        else: assemblyVersion = vsver.internVersion(getInheritedVersion(buildInfo, "AssemblyVersion", "1.0.0.0"))
         assemFileVersionNode = root.find("PropertyGroup/FileVersion")
-        if assemFileVersionNode != None: assemblyFileVersion = vsver.SemVersion(assemFileVersionNode.text)
-        else: assemblyFileVersion = version
+        if assemFileVersionNode != None: assemblyFileVersion = vsver.internVersion(assemFileVersionNode.text)
+        else:
+            inheritedVersion = getInheritedVersion(buildInfo, "FileVersion", None)
+            if inheritedVersion != None: assemblyFileVersion = vsver.internVersion(inheritedVersion)
+            else: assemblyFileVersion = version
         projInfo.projRefInfo.id = assemblyName
         projInfo.projRefInfo.version = version
         projInfo.assemblyVersion = assemblyVersion
@@ -131,18 +366,15 @@ def getProjectInfo(projectFilename): # return ProjectFileInfo
                     assemblyInfoFileName = incAttr
                     break
             if assemblyInfoFileName != None:
-                projInfo.asmInfoPath = os.path.abspath(os.path.join(projpath, assemblyInfoFileName))
+                projInfo.asmInfoPath = vsdir.getAbsPath(projpath, assemblyInfoFileName)
                 try:
-                    f = open(projInfo.asmInfoPath, "r", encoding="utf-8")
-                    #[assembly: AssemblyVersion("1.0.2.0")]
-                    #[assembly: AssemblyFileVersion("1.0.2.0")]                
-                    for line in f:
-                        if re.match(r"\s*\[assembly:\s*AssemblyVersion\(\s*\".*\s*\"\)\]", line):
-                            token = re.findall(r"\(\"\s*(.*)\s*\"\)", line)
-                            if token: assemblyVersion = vsver.SemVersion(token[0], 4)
-                        elif re.match(r"\s*\[assembly:\s*AssemblyFileVersion\(\s*\".*\s*\"\)\]", line):
-                            token = re.findall(r"\(\"\s*(.*)\s*\"\)", line)
-                            if token: assemblyFileVersion = vsver.SemVersion(token[0], 4)
+                    with open(projInfo.asmInfoPath, "r", encoding="utf-8") as f:
+                        text = f.read()
+                    vsprof.addCount("assemblyInfoFilesRead")
+                    vsprof.addCount("assemblyInfoCharsRead", len(text))
+                    asmValues = scanAssemblyInfo(text)
+                    if "AssemblyVersion" in asmValues: assemblyVersion = vsver.internVersion(asmValues["AssemblyVersion"])
+                    if "AssemblyFileVersion" in asmValues: assemblyFileVersion = vsver.internVersion(asmValues["AssemblyFileVersion"])
                 except PermissionError:
                     print("error")
                     pass
@@ -159,10 +391,13 @@ def getProjectInfo(projectFilename): # return ProjectFileInfo
         refpkgs = root.findall("vsproj:ItemGroup/vsproj:PackageReference", ns)
     else:
         refpkgs = root.findall("ItemGroup/PackageReference")
+    pkgRefs = list()
     for pkg in refpkgs: 
         refver = None
         if 'Version' in pkg.attrib:
             refver = pkg.attrib['Version']
+        elif 'VersionOverride' in pkg.attrib:
+            refver = pkg.attrib['VersionOverride']
         else:
             if ns != None:
                 rv = pkg.find('vsproj:Version', ns)
@@ -170,47 +405,48 @@ def getProjectInfo(projectFilename): # return ProjectFileInfo
                 rv = pkg.find('Version')
             if rv != None:
                 refver = rv.text
-        if not refver: refver = "1.0.0"
-        projInfo.refPkgs.append(ProjectRefInfo(pkg.attrib['Include'], vsver.SemVersion(refver)))
+        pkgRefs.append((pkg.attrib['Include'], refver))
+    if ns != None:
+        centralNode = root.find("vsproj:PropertyGroup/vsproj:ManagePackageVersionsCentrally", ns)
+    else:
+        centralNode = root.find("PropertyGroup/ManagePackageVersionsCentrally")
+    isCentral = vsprops.isCentralManaged(buildInfo, packagesInfo, centralNode.text if centralNode != None else None)
+    addPackageReferences(projInfo, pkgRefs, buildInfo, packagesInfo, isCentral)
 
     if ns != None:
         refprojs = root.findall("vsproj:ItemGroup/vsproj:ProjectReference", ns)
     else:
         refprojs = root.findall("ItemGroup/ProjectReference")
     for proj in refprojs:
-        projInfo.refPrjs.append(os.path.abspath(os.path.join(projpath, proj.attrib['Include'])))
+        projInfo.addRefPrj(vsdir.getAbsPath(projpath, proj.attrib['Include']))
 
-    nuspecPath = os.path.join(projpath, "Module.nuspec")
-    if(os.path.exists(nuspecPath)):
-        readNugetRefs(projInfo, nuspecPath)
+    projInfo.projAnchors = getProjectAnchors(doc, ns)
+    projInfo.projData = doc.data
+
+    if ns != None:
+        ispkgnode = root.find("vsproj:PropertyGroup/vsproj:GeneratePackageOnBuild", ns)
     else:
-        if ns != None:
-            ispkgnode = root.find("vsproj:PropertyGroup/vsproj:GeneratePackageOnBuild", ns)
-        else:
-            ispkgnode = root.find("PropertyGroup/GeneratePackageOnBuild")
-        if ispkgnode != None:
-            ispkg = bool(ispkgnode.text)
-        else:        
-            pkgInfoPath = os.path.join(projpath, "Packageinfo.json")
-            if(os.path.exists(pkgInfoPath)):
-                readPackageInfo(projInfo, pkgInfoPath)
+        ispkgnode = root.find("PropertyGroup/GeneratePackageOnBuild")
+    readPackageSource(projInfo, projpath, ispkgnode != None)
 
     return projInfo
 
 
 def readNugetRefs(projInfo, nuspecPath):
-    if not os.path.exists(nuspecPath): return
+    if not vsdir.exists(nuspecPath): return
 
-    doc = etree.parse(nuspecPath)
-    root = doc.getroot()
+    doc = vsxml.parseXmlFile(nuspecPath)
+    root = doc.root
 
     projInfo.projRefInfo.id = root.find("metadata/id").text
-    projInfo.projRefInfo.version = vsver.SemVersion(root.find("metadata/version").text)
+    projInfo.projRefInfo.version = vsver.internVersion(root.find("metadata/version").text)
     projInfo.packageId = projInfo.projRefInfo.id
+    projInfo.nuspecAnchors = getNugetAnchors(doc)
+    projInfo.nuspecData = doc.data
 
 
 def readPackageInfo(projInfo, pkgjInfoPath):
-    if not os.path.exists(pkgjInfoPath): return
+    if not vsdir.exists(pkgjInfoPath): return
 
     with open(pkgjInfoPath, 'r', encoding="utf-8") as f:
         pkgInfoData = json.load(f)
@@ -218,130 +454,205 @@ def readPackageInfo(projInfo, pkgjInfoPath):
     projInfo.packageId = pkgInfoData.get("package.id")
 
 
-def updateProjectInfo(projInfo, projDict, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList):
-    projpath = os.path.dirname(projInfo.projRefInfo.projectPath)
-
-    doc = etree.parse(projInfo.projRefInfo.projectPath)
-    root = doc.getroot()    
-    token = re.findall(r"^\{\s*(.*)\s*\}", root.tag)
-    if token: 
-        ns = {"vsproj": token[0]}
-        etree.register_namespace("", token[0])
-    else:
-        ns = None
-
-    isCsprojFileChange = False
-
+def getNugetDependencyValues(projInfo, projDict): # return dict of dependency id -> new version string
+    # a package reference wins over a project reference with the same id, even when it is not bumped;
+    # among project references sharing an id only the first one counts, bumped or not
+    depValues = dict()
+    seenIds = set()
+    for refpath in projInfo.refPrjs:
+        refProj = projDict.get(refpath)
+        if refProj == None: continue
+        refInfo = refProj.projRefInfo
+        if (refInfo.id in seenIds) or (refInfo.id in projInfo.refPkgDict): continue
+        seenIds.add(refInfo.id)
+        if vsver.VersionCompare(refInfo.newVersion, refInfo.version) > 0:
+            depValues[refInfo.id] = refInfo.newVersion.toString(3)
+    for refId, refInfo in projInfo.refPkgDict.items():
+        if vsver.VersionCompare(refInfo.newVersion, refInfo.version) > 0:
+            depValues[refId] = refInfo.newVersion.toString(3)
+    return depValues
+
+
+def getProjectEdits(projInfo, projDict, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList): # return dict or None when excluded
+    refInfo = projInfo.projRefInfo
+    projpath = os.path.dirname(refInfo.projectPath)
+    newVersion = refInfo.newVersion
+
+    edits = {
+        "id": refInfo.id,
+        "projectPath": refInfo.projectPath,
+        "version": refInfo.version.toString() if refInfo.version != None else None,
+        "newVersion": newVersion.toString(),
+        "csproj": None,
+        "assemblyInfo": None,
+        "nuspec": None,
+        "props": None
+    }
+
+    propValues = list()
     if not projInfo.isTestProject:
-        if projInfo.projRefInfo.id in excludePackageList: return
+        if refInfo.id in excludePackageList: return None
 
         if projInfo.asmInfoPath == None:
-            firstPropertiesNode = root.find("PropertyGroup")
-            if firstPropertiesNode == None:
-                firstPropertiesNode = etree.SubElement(root, "PropertyGroup")
-                firstPropertiesNode.tail = "\n"
-
-            versionNode = root.find("PropertyGroup/Version")
-            if versionNode == None:
-                versionNode = etree.SubElement(firstPropertiesNode, "Version")
-                versionNode.tail = "\n"
-            versionNode.text = projInfo.projRefInfo.newVersion.toString(3)
-
-            if projInfo.projRefInfo.id in assemblyChangePackageList:
-                asemVersionNode = root.find("PropertyGroup/AssemblyVersion")
-                if asemVersionNode == None:
-                    asemVersionNode = etree.SubElement(firstPropertiesNode, "AssemblyVersion")
-                    asemVersionNode.tail = "\n"
-                asemVersionNode.text = projInfo.projRefInfo.newVersion.toString(4, False)
-
-            if projInfo.projRefInfo.id in assemblyFileChangePackageList:
-                fileVersionNode = root.find("PropertyGroup/FileVersion")
-                if fileVersionNode == None:
-                    fileVersionNode = etree.SubElement(firstPropertiesNode, "FileVersion")
-                    fileVersionNode.tail = "\n"
-                fileVersionNode.text = projInfo.projRefInfo.newVersion.toString(4, False)
-
-            isCsprojFileChange = True
+            propValues.append(("Version", newVersion.toString(3)))
+            if refInfo.id in assemblyChangePackageList:
+                propValues.append(("AssemblyVersion", newVersion.toString(4, False)))
+            if refInfo.id in assemblyFileChangePackageList:
+                propValues.append(("FileVersion", newVersion.toString(4, False)))
         else:
-            try:
-                f = open(projInfo.asmInfoPath, "r", encoding="utf-8")
-                #[assembly: AssemblyVersion("1.0.2.0")]
-                #[assembly: AssemblyFileVersion("1.0.2.0")]    
-                allline = list()
-                for line in f:
-                    if re.match(r"\s*\[assembly:\s*AssemblyVersion\(\s*\".*\s*\"\)\]", line):
-                        if projInfo.projRefInfo.id in assemblyChangePackageList:
-                            line = "[assembly: AssemblyVersion(\"" + projInfo.projRefInfo.newVersion.toString(4, False) + "\")]\n"
-                    elif re.match(r"\s*\[assembly:\s*AssemblyFileVersion\(\s*\".*\s*\"\)\]", line):
-                        if projInfo.projRefInfo.id in assemblyFileChangePackageList:
-                            line = "[assembly: AssemblyFileVersion(\"" + projInfo.projRefInfo.newVersion.toString(4, False) + "\")]\n"
-                    allline.append(line)
-                f.close()
-                f = open(projInfo.asmInfoPath, "w", encoding="utf-8")
-                f.write("".join(allline))
-                f.close()
-            except PermissionError:
-                print("error")
-                pass
-
-    if ns != None:
-        refpkgs = root.findall("vsproj:ItemGroup/vsproj:PackageReference", ns)
-    else:
-        refpkgs = root.findall("ItemGroup/PackageReference")
-    for pkg in refpkgs: 
-        refver = None
-        pkgName = pkg.attrib['Include']
-        refInfo = findRefInfo(projInfo.refPkgs, pkgName)
-        if refInfo == None: continue
-        if vsver.VersionCompare(refInfo.newVersion, refInfo.version) > 0:
-            if 'Version' in pkg.attrib:
-                pkg.attrib['Version'] = refInfo.newVersion.toString(3)
-            else:
-                if ns != None:
-                    rv = pkg.find("vsproj:Version", ns)
-                else:
-                    rv = pkg.find("Version")
-                if rv != None:
-                    rv.text = refInfo.newVersion.toString(3)
-            isCsprojFileChange = True
-    
-    if isCsprojFileChange:
-        #doc.write(projInfo.projRefInfo.projectPath, encoding="utf-8", pretty_print=True, xml_declaration=True)
-        #doc.write(projInfo.projRefInfo.projectPath, encoding="utf-8", pretty_print=True, doctype='<?xml version="1.0" encoding="utf-8"?>')
-        doc.write(projInfo.projRefInfo.projectPath, encoding="utf-8", xml_declaration=True)
+            asmValues = dict()
+            if refInfo.id in assemblyChangePackageList:
+                asmValues["AssemblyVersion"] = newVersion.toString(4, False)
+            if refInfo.id in assemblyFileChangePackageList:
+                asmValues["AssemblyFileVersion"] = newVersion.toString(4, False)
+            if asmValues:
+                edits["assemblyInfo"] = {"path": projInfo.asmInfoPath, "values": asmValues}
+
+    pkgValues = dict()
+    propsValues = dict() # props filename -> dict package id -> version string
+    for refId, pkgRefInfo in projInfo.refPkgDict.items():
+        if vsver.VersionCompare(pkgRefInfo.newVersion, pkgRefInfo.version) > 0:
+            propsPath = projInfo.propsRefPaths.get(refId)
+            if propsPath != None: propsValues.setdefault(propsPath, dict())[refId] = pkgRefInfo.newVersion.toString(3)
+            else: pkgValues[refId] = pkgRefInfo.newVersion.toString(3)
+    if propsValues:
+        edits["props"] = [{"path": path, "packageVersions": values} for path, values in propsValues.items()]
+
+    if propValues or pkgValues:
+        edits["csproj"] = {"properties": propValues, "packageReferences": pkgValues}
 
     nuspecPath = os.path.join(projpath, "Module.nuspec")
-    updateNugetRefs(projInfo, nuspecPath, projDict)
-
-
-def updateNugetRefs(projInfo, nuspecPath, projDict):
-    if not os.path.exists(nuspecPath): return
-
-    doc = etree.parse(nuspecPath)
-    root = doc.getroot()
-
-    #root.find("metadata/version").text = vsver.convProjectVersion(projInfo.projRefInfo.newVersion)
-    root.find("metadata/version").text = projInfo.projRefInfo.newVersion.toString(3)
-
-    deps = root.findall("metadata/dependencies/dependency")
-    deps2 = root.findall("metadata/dependencies/group/dependency")
-    deps.extend(deps2)
-    for dep in deps:
-        id = dep.attrib['id']
-        isfind = False
-        for refInfo in projInfo.refPkgs:
-            if refInfo.id == id:
-                if vsver.VersionCompare(refInfo.newVersion, refInfo.version) > 0:
-                    dep.attrib['version'] = refInfo.newVersion.toString(3)
-                isfind = True
-                break
-        if isfind: continue
-        for refpath in projInfo.refPrjs:
-            refInfo = projDict[refpath].projRefInfo
-            if refInfo.id == id:
-                if vsver.VersionCompare(refInfo.newVersion, refInfo.version) > 0:
-                    dep.attrib['version'] = refInfo.newVersion.toString(3)
-                break
-
-    #doc.write(nuspecPath, encoding="utf-8", pretty_print=True, doctype='<?xml version="1.0" encoding="utf-8"?>')
-    doc.write(nuspecPath, encoding="utf-8", xml_declaration=True)
+    if vsdir.exists(nuspecPath):
+        edits["nuspec"] = {"path": nuspecPath, "version": newVersion.toString(3), "dependencies": getNugetDependencyValues(projInfo, projDict)}
+
+    return edits
+
+
+def applyProjectEdits(edits, projInfo = None, writer = None, propsEdits = None):
+    # shared props files are patched once for all projects when the caller collects propsEdits
+    if edits["assemblyInfo"] != None:
+        patchAssemblyInfo(edits["assemblyInfo"]["path"], edits["assemblyInfo"]["values"], writer)
+    if edits["csproj"] != None:
+        patchProjectFile(edits["projectPath"], edits["csproj"]["properties"], edits["csproj"]["packageReferences"], projInfo, writer)
+    if edits["nuspec"] != None:
+        with vsprof.phase("updateNugetRefs"):
+            patchNugetFile(edits["nuspec"]["path"], edits["nuspec"]["version"], edits["nuspec"]["dependencies"], projInfo, writer)
+    if edits.get("props"):
+        if propsEdits != None: vsprops.mergePropsEdits(propsEdits, edits["props"])
+        else: applyPropsEdits(vsprops.mergePropsEdits(dict(), edits["props"]), writer)
+
+
+@vsprof.timed("updateProjectInfo")
+def updateProjectInfo(projInfo, projDict, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList, writer = None, propsEdits = None):
+    edits = getProjectEdits(projInfo, projDict, assemblyChangePackageList, assemblyFileChangePackageList, excludePackageList)
+    if edits != None: applyProjectEdits(edits, projInfo, writer, propsEdits)
+
+
+def writePatchedFile(filename, newData, data, writer = None):
+    if newData == data: return
+    if writer != None: writer.add(filename, newData, data)
+    else: vsxml.writeFileBytes(filename, newData)
+
+
+def loadPatchSource(filename, anchors, data, getAnchors, writer = None): # return (anchors, bytes)
+    pending = None
+    if writer != None: pending = writer.getPending(filename)
+    if pending != None:
+        # another project of this batch already changed the file
+        return getAnchors(vsxml.parseXmlBytes(pending)), pending
+    if anchors != None:
+        data = vsxml.readPatchData(filename, anchors["stamp"], data)
+        if data != None: return anchors, data
+    # no offsets from the analysis or the file changed since; take them again
+    doc = vsxml.parseXmlFile(filename)
+    return getAnchors(doc), doc.data
+
+
+@vsprof.timed("patchAssemblyInfo")
+def patchAssemblyInfo(asmInfoPath, asmValues, writer = None):
+    try:
+        data = None
+        if writer != None: data = writer.getPending(asmInfoPath)
+        if data == None:
+            with open(asmInfoPath, "rb") as f:
+                data = f.read()
+        # same newline handling as a text mode read and write
+        text = data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+        newText = rewriteAssemblyInfo(text, asmValues)
+        if newText != text:
+            writePatchedFile(asmInfoPath, newText.replace("\n", os.linesep).encode("utf-8"), data, writer)
+    except PermissionError:
+        print("error")
+        pass
+
+
+@vsprof.timed("patchProjectFile")
+def patchProjectFile(projectPath, propValues, pkgValues, projInfo = None, writer = None):
+    anchors = None
+    data = None
+    if projInfo != None:
+        anchors = projInfo.projAnchors
+        data = projInfo.projData
+    anchors, data = loadPatchSource(projectPath, anchors, data, lambda doc: getProjectAnchors(doc, getNamespaces(doc.root)), writer)
+
+    edits = list()
+    missing = list()
+    for tagName, value in propValues:
+        anchor = anchors["props"].get(tagName)
+        if anchor != None: edits.append(vsxml.makeEdit(anchor, value))
+        else: missing.append((tagName, value))
+    if missing:
+        if anchors["group"] != None:
+            for tagName, value in missing:
+                edits.append(vsxml.makeEdit(anchors["group"], value, tagName))
+        elif anchors["root"] != None:
+            pos = anchors["root"][1]
+            edits.append((pos, pos, vsxml.renderGroup(anchors["root"], "PropertyGroup", missing)))
+
+    for pkgName, anchor in anchors["packageRefs"]:
+        value = pkgValues.get(pkgName)
+        if value != None and anchor != None: edits.append(vsxml.makeEdit(anchor, value))
+
+    writePatchedFile(projectPath, vsxml.spliceEdits(data, edits), data, writer)
+
+
+@vsprof.timed("patchNugetFile")
+def patchNugetFile(nuspecPath, version, depValues, projInfo = None, writer = None):
+    if not vsdir.exists(nuspecPath): return
+
+    anchors = None
+    data = None
+    if projInfo != None:
+        anchors = projInfo.nuspecAnchors
+        data = projInfo.nuspecData
+    anchors, data = loadPatchSource(nuspecPath, anchors, data, getNugetAnchors, writer)
+
+    edits = [vsxml.makeEdit(anchors["version"], version)]
+    for id, anchor, versionRange in anchors["deps"]:
+        value = depValues.get(id)
+        if value == None: continue
+        if versionRange != None and versionRange.contains(vsver.internVersion(value)): continue
+        edits.append(vsxml.makeEdit(anchor, value))
+
+    writePatchedFile(nuspecPath, vsxml.spliceEdits(data, edits), data, writer)
+
+
+@vsprof.timed("patchPropsFile")
+def patchPropsFile(propsPath, pkgValues, writer = None):
+    anchors = None
+    info = vsprops.propsCache.files.get(propsPath)
+    if info != None: anchors = info.anchors
+    anchors, data = loadPatchSource(propsPath, anchors, None, vsprops.getPropsAnchors, writer)
+
+    edits = list()
+    for pkgId, value in pkgValues.items():
+        anchor = anchors["packageVersions"].get(pkgId)
+        if anchor == None: anchor = anchors["packageRefs"].get(pkgId)
+        if anchor != None: edits.append(vsxml.makeEdit(anchor, value))
+
+    writePatchedFile(propsPath, vsxml.spliceEdits(data, edits), data, writer)
+
+
+def applyPropsEdits(propsEdits, writer = None): # propsEdits: dict props filename -> dict package id -> version string
+    for propsPath, pkgValues in propsEdits.items():
+        if pkgValues: patchPropsFile(propsPath, pkgValues, writer)
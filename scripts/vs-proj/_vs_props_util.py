@@ -0,0 +1,162 @@
+import sys
+import os
+import re
+import _vs_xml_util as vsxml
+import _vs_version_util as vsver
+import _vs_dir_util as vsdir
+
+
+BUILD_PROPS_NAME = "Directory.Build.props"
+PACKAGES_PROPS_NAME = "Directory.Packages.props"
+INHERITED_PROPERTY_NAMES = ("Version", "AssemblyVersion", "FileVersion", "ManagePackageVersionsCentrally")
+# property functions and $(...) references are not evaluated, such values are ignored
+LITERAL_VERSION_RE = re.compile(r"^\d+(\.\d+)*(-[0-9A-Za-z.-]+)?$")
+
+
+class PropsFileInfo:
+    #path = None
+    #properties = None # dict() : property name -> text of the first root/PropertyGroup/<name>
+    #packageRefs = None # list() : (Include, version text or None) of root/ItemGroup/PackageReference
+    #packageVersions = None # dict() : package id -> version text of root/ItemGroup/PackageVersion
+    #anchors = None # byte offsets for patching the file
+    __slots__ = ("path", "properties", "packageRefs", "packageVersions", "anchors")
+
+    def __init__(self, path):
+        self.path = path
+        self.properties = dict()
+        self.packageRefs = list()
+        self.packageVersions = dict()
+        self.anchors = None
+
+    def getVersion(self, name): # return the literal version text of a property or None
+        value = self.properties.get(name)
+        if value == None or not LITERAL_VERSION_RE.match(value.strip()): return None
+        return value.strip()
+
+    def isCentral(self):
+        value = self.properties.get("ManagePackageVersionsCentrally")
+        return value != None and value.strip().lower() == "true"
+
+
+def getLocalName(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def getItemVersion(doc, node): # return (version text, anchor) of an item's Version attribute or child element
+    if 'Version' in node.attrib:
+        return node.attrib['Version'], doc.getAttrAnchor(node, 'Version')
+    for child in node:
+        if getLocalName(child.tag) == "Version": return child.text, doc.getTextAnchor(child)
+    return None, None
+
+
+def readPropsDocument(doc, path): # return PropsFileInfo
+    info = PropsFileInfo(path)
+    anchors = {"stamp": doc.stamp, "props": dict(), "packageRefs": dict(), "packageVersions": dict()}
+    for group in doc.root:
+        groupName = getLocalName(group.tag)
+        if groupName == "PropertyGroup":
+            for node in group:
+                name = getLocalName(node.tag)
+                if (name in INHERITED_PROPERTY_NAMES) and not (name in info.properties):
+                    info.properties[name] = node.text
+                    anchors["props"][name] = doc.getTextAnchor(node)
+        elif groupName == "ItemGroup":
+            for node in group:
+                name = getLocalName(node.tag)
+                include = node.attrib.get('Include')
+                if include == None: continue
+                if name == "PackageReference":
+                    version, anchor = getItemVersion(doc, node)
+                    info.packageRefs.append((include, version))
+                    anchors["packageRefs"].setdefault(include, anchor)
+                elif name == "PackageVersion":
+                    version, anchor = getItemVersion(doc, node)
+                    if version == None or (include in info.packageVersions): continue
+                    info.packageVersions[include] = version
+                    anchors["packageVersions"][include] = anchor
+    info.anchors = anchors
+    return info
+
+
+def getPropsAnchors(doc):
+    return readPropsDocument(doc, None).anchors
+
+
+class PropsCache:
+    #dirPaths = None # dict() : (directory, props file name) -> nearest props filename or None
+    #files = None # dict() : props filename -> PropsFileInfo
+    def __init__(self):
+        self.dirPaths = dict()
+        self.files = dict()
+
+    def findPropsFile(self, dirname, propsName): # return the nearest propsName at or above dirname, or None
+        key = (dirname, propsName)
+        if key in self.dirPaths: return self.dirPaths[key]
+        path = os.path.join(dirname, propsName)
+        if vsdir.isFile(path):
+            result = path
+        else:
+            parent = os.path.dirname(dirname)
+            if parent == dirname: result = None
+            else: result = self.findPropsFile(parent, propsName)
+        self.dirPaths[key] = result
+        return result
+
+    def getLookupPaths(self, dirname, propsName): # return every propsName path findPropsFile checks from dirname up, the found one last
+        # a props file added later in one of the missing places takes over, so they are all dependencies of the project
+        paths = list()
+        found = self.findPropsFile(dirname, propsName)
+        while True:
+            path = os.path.join(dirname, propsName)
+            paths.append(path)
+            if path == found: break
+            parent = os.path.dirname(dirname)
+            if parent == dirname: break
+            dirname = parent
+        return paths
+
+    def getPropsInfo(self, path): # return PropsFileInfo, parsed once per file version
+        if path == None: return None
+        info = self.files.get(path)
+        if info != None and info.anchors["stamp"] == vsxml.getFileStamp(path): return info
+        info = readPropsDocument(vsxml.parseXmlFile(path), path)
+        self.files[path] = info
+        return info
+
+    def getDirectoryProps(self, dirname): # return (Directory.Build.props info, Directory.Packages.props info), None when missing
+        buildInfo = self.getPropsInfo(self.findPropsFile(dirname, BUILD_PROPS_NAME))
+        packagesInfo = self.getPropsInfo(self.findPropsFile(dirname, PACKAGES_PROPS_NAME))
+        return buildInfo, packagesInfo
+
+
+propsCache = PropsCache()
+
+
+def clearCache():
+    global propsCache
+    propsCache = PropsCache()
+
+
+def getDirectoryProps(dirname):
+    return propsCache.getDirectoryProps(dirname)
+
+
+def getLookupPaths(dirname): # return the Directory.Build.props and Directory.Packages.props paths checked for dirname
+    return propsCache.getLookupPaths(dirname, BUILD_PROPS_NAME) + propsCache.getLookupPaths(dirname, PACKAGES_PROPS_NAME)
+
+
+def isCentralManaged(buildInfo, packagesInfo, projectValue = None): # return True when PackageVersion items of packagesInfo apply
+    if packagesInfo == None: return False
+    if projectValue != None: return projectValue.strip().lower() == "true"
+    return packagesInfo.isCentral() or (buildInfo != None and buildInfo.isCentral())
+
+
+def mergePropsEdits(propsEdits, editsList): # propsEdits: dict props filename -> dict package id -> version string
+    # many projects ask for the same shared version, the highest one wins
+    for edits in editsList:
+        values = propsEdits.setdefault(edits["path"], dict())
+        for pkgId, version in edits["packageVersions"].items():
+            if not (pkgId in values) or vsver.VersionCompare(vsver.internVersion(version), vsver.internVersion(values[pkgId])) > 0:
+                values[pkgId] = version
+    return propsEdits
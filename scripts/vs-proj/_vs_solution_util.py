@@ -1,23 +1,52 @@
 import sys
 import os
+import io
 import re
+import glob
+import functools
+import contextlib
 import _vs_project_util as vsproj
+import _vs_graph_util as vsgraph
+import _vs_profile_util as vsprof
+
+
+SLN_PROJECT_RE = re.compile(r"\s*Project\s*\(\s*\"\{.*\}\"\s*\)")
+SLN_PROJECT_NAMES_RE = re.compile(r"=\s*\"([^\"]*)\"\s*,\s*\"([^\"]*)\"")
 
 
 class SolutionFileInfo:
     #solutionFilePath = None
+    #solutionFilePaths = None # list() : every solution of a workspace
     #projectList = None # list()
     #projectDict = None # dict()
     def __init__(self):
         self.solutionFilePath = None
+        self.solutionFilePaths = None
         self.projectList = None # list()
         self.projectDict = None # dict()
+        self.projectGraph = None
+        self.impactIndex = None
 
     def updateProjectDict(self):
         self.projectDict = dict()
         for proj in self.projectList:
             if proj.projRefInfo.id != None: self.projectDict[proj.projRefInfo.id] = proj
             if proj.projRefInfo.projectPath != None: self.projectDict[proj.projRefInfo.projectPath] = proj
+        self.projectGraph = None
+        self.impactIndex = None
+
+    def getProjectGraph(self):
+        if self.projectGraph == None: self.projectGraph = vsgraph.ProjectGraph(self.projectList, self.projectDict)
+        return self.projectGraph
+
+    def getImpactIndex(self, presig = ""):
+        if self.impactIndex == None or self.impactIndex.presig != presig: self.impactIndex = vsgraph.ImpactIndex(self.getProjectGraph(), presig)
+        return self.impactIndex
+
+    def resetVersionChanges(self):
+        for proj in self.projectList:
+            proj.projRefInfo.newVersion = None
+            for ref in proj.refPkgs: ref.newVersion = None
 
     def getProject(self, packageName):
         return self.projectDict[packageName]
@@ -26,30 +55,123 @@ class SolutionFileInfo:
         return self.projectDict[path]
 
 
-def getSolutionInfo(solutionFilename):
+def parseProjectFile(projectFilename, keepDocuments = True): # return ProjectFileInfo
+    projInfo = vsproj.getProjectInfo(projectFilename)
+    # dropping the file bytes here also keeps them out of the worker -> parent pickles
+    if not keepDocuments: projInfo.releaseDocuments()
+    return projInfo
+
+
+def parseProjectFileInWorker(projectFilename, keepDocuments = True, profile = False): # return (ProjectFileInfo, Profiler or None, printed text)
+    # workers share the stdout of the parent, lines written there directly interleave; the parent prints them in order
+    if profile: vsprof.enable()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        projInfo = parseProjectFile(projectFilename, keepDocuments)
+    profiler = None
+    if profile: profiler = vsprof.disable()
+    return projInfo, profiler, output.getvalue()
+
+
+def iterProjectInfo(projectFilenames, jobs = 1, keepDocuments = True): # yield ProjectFileInfo in the given order
+    if jobs == None or jobs <= 0: jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(projectFilenames))
+    if jobs <= 1:
+        for filename in projectFilenames:
+            yield parseProjectFile(filename, keepDocuments)
+        return
+
+    import concurrent.futures
+    # executor.map keeps the input order, so the result follows the solution order
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        chunksize = max(1, len(projectFilenames) // (jobs * 4))
+        profile = vsprof.isEnabled()
+        for projInfo, profiler, output in executor.map(functools.partial(parseProjectFileInWorker, keepDocuments=keepDocuments, profile=profile), projectFilenames, chunksize=chunksize):
+            if profiler != None: vsprof.profiler.merge(profiler)
+            sys.stdout.write(output)
+            yield projInfo
+
+
+def getProjectInfoList(projectFilenames, jobs = 1, keepDocuments = True):
+    return list(iterProjectInfo(projectFilenames, jobs, keepDocuments))
+
+
+def iterSolutionProjects(solutionFilename): # yield (project name, .csproj filename) for each project line of the solution
+    slnPath = os.path.dirname(solutionFilename)
+    with open(solutionFilename, "r", encoding="utf-8") as f:
+        vsprof.addCount("slnFilesRead")
+        for line in f:
+            if not SLN_PROJECT_RE.match(line): continue
+            token = SLN_PROJECT_NAMES_RE.search(line)
+            if token and token.group(2).endswith(".csproj"):
+                yield token.group(1), os.path.join(slnPath, token.group(2))
+
+
+def getSolutionProjectFilenames(solutionFilename): # return list of .csproj filenames in the solution
+    # only the names are kept, so the .sln is closed before any project is parsed
+    return [filename for projname, filename in iterSolutionProjects(solutionFilename)]
+
+
+def expandSolutionFilenames(patterns): # return list of solution filenames; glob patterns are expanded in sorted order
+    solutionFilenames = list()
+    for pattern in patterns:
+        if any(c in pattern for c in "*?["):
+            matches = sorted(glob.glob(pattern, recursive=True))
+            if matches:
+                solutionFilenames.extend(matches)
+                continue
+        solutionFilenames.append(pattern)
+    return solutionFilenames
+
+
+def getWorkspaceProjectFilenames(solutionFilenames): # return list of .csproj filenames of all solutions, each project once
+    projectFilenames = list()
+    seen = set()
+    for solutionFilename in solutionFilenames:
+        for filename in getSolutionProjectFilenames(solutionFilename):
+            path = os.path.abspath(filename)
+            if path in seen: continue
+            seen.add(path)
+            projectFilenames.append(filename)
+    return projectFilenames
+
+
+def loadProjects(solInfo, projectFilenames, jobs = 1, cache = None, keepDocuments = True):
+    if cache != None:
+        solInfo.projectList = cache.getProjectInfoList(projectFilenames, lambda filenames: getProjectInfoList(filenames, jobs, keepDocuments))
+    else:
+        solInfo.projectList = getProjectInfoList(projectFilenames, jobs, keepDocuments)
+    solInfo.updateProjectDict()
+    return solInfo
+
+
+@vsprof.timed("getSolutionInfo")
+def getSolutionInfo(solutionFilename, jobs = 1, cache = None, keepDocuments = True):
     #solutionFilename = os.path.abspath(solutionFilename)
     print(solutionFilename)
     try:
-        f = open(solutionFilename, "r", encoding="utf-8")
-
         solInfo = SolutionFileInfo()
         solInfo.solutionFilePath = solutionFilename
-        
-        solInfo.projectList = list()
-        for line in f:
-            if re.match(r"\s*Project\s*\(\s*\"\{.*\}\"\s*\)", line):
-                token = re.findall(r"=\s*\"([^\"]*)\"\s*,\s*\"([^\"]*)\"", line)
-                if token: 
-                    projname = token[0][0]
-                    filename = token[0][1]
-                    if filename.endswith(".csproj"):
-                        slnPath = os.path.dirname(solutionFilename)
-                        filename = os.path.join(slnPath, filename)
-                        solInfo.projectList.append(vsproj.getProjectInfo(filename))
+        solInfo.solutionFilePaths = [solutionFilename]
+        loadProjects(solInfo, getSolutionProjectFilenames(solutionFilename), jobs, cache, keepDocuments)
     except PermissionError:
         print("error")
-        return null
- 
-    solInfo.updateProjectDict()
+        return None
+
+    return solInfo
+
+
+@vsprof.timed("getSolutionInfo")
+def getWorkspaceInfo(solutionFilenames, jobs = 1, cache = None, keepDocuments = True):
+    # projects shared by several solutions are parsed once and share one graph
+    for solutionFilename in solutionFilenames: print(solutionFilename)
+    try:
+        solInfo = SolutionFileInfo()
+        solInfo.solutionFilePath = solutionFilenames[0]
+        solInfo.solutionFilePaths = list(solutionFilenames)
+        loadProjects(solInfo, getWorkspaceProjectFilenames(solutionFilenames), jobs, cache, keepDocuments)
+    except PermissionError:
+        print("error")
+        return None
 
     return solInfo
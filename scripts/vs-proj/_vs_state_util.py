@@ -0,0 +1,100 @@
+import sys
+import os
+import copy
+import pickle
+import _vs_solution_util as vssol
+import _vs_cache_util as vscache
+
+
+STATE_FORMAT_VERSION = 1
+
+
+def getSolutionStamps(solutionFilenames): # return list of (absolute path, (size, mtime_ns) or None)
+    stamps = list()
+    for filename in solutionFilenames:
+        try:
+            st = os.stat(filename)
+            stamp = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            stamp = None
+        stamps.append((os.path.abspath(filename), stamp))
+    return stamps
+
+
+def writeState(stateFilename, solInfo):
+    # the file contents are re-read on demand, there is no need to keep them in the state
+    projects = list()
+    for projInfo in solInfo.projectList:
+        projInfo = copy.copy(projInfo)
+        projInfo.releaseDocuments()
+        projects.append(projInfo)
+    state = {
+        "format": STATE_FORMAT_VERSION,
+        "cacheFormat": vscache.CACHE_FORMAT_VERSION,
+        "solutions": getSolutionStamps(solInfo.solutionFilePaths),
+        "projects": projects
+    }
+    tmpPath = stateFilename + ".tmp"
+    try:
+        with open(tmpPath, "wb") as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpPath, stateFilename)
+    except OSError:
+        print("> Cannot write state", stateFilename)
+
+
+def readState(stateFilename, solutionFilenames): # return list of ProjectFileInfo or None when the state does not match the solutions
+    try:
+        with open(stateFilename, "rb") as f:
+            state = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+    if state.get("format") != STATE_FORMAT_VERSION or state.get("cacheFormat") != vscache.CACHE_FORMAT_VERSION: return None
+    # a changed solution may add or remove projects, that needs a full scan
+    if state.get("solutions") != getSolutionStamps(solutionFilenames): return None
+    return state["projects"]
+
+
+def getAffectedProjects(projectList, changedFiles): # return indexes of the projects reading any of changedFiles
+    changed = set(os.path.normcase(os.path.abspath(filename)) for filename in changedFiles)
+    affected = list()
+    for idx, projInfo in enumerate(projectList):
+        for filename in vscache.getProjectDependFiles(projInfo):
+            if os.path.normcase(os.path.abspath(filename)) in changed:
+                affected.append(idx)
+                break
+    return affected
+
+
+def refreshProjects(solInfo, changedFiles, jobs = 1, keepDocuments = True): # re-parse the projects reading changedFiles; return their paths
+    affected = getAffectedProjects(solInfo.projectList, changedFiles)
+    if not affected: return list()
+    projectPaths = [solInfo.projectList[idx].projRefInfo.projectPath for idx in affected]
+    for idx, projInfo in zip(affected, vssol.getProjectInfoList(projectPaths, jobs, keepDocuments)):
+        solInfo.projectList[idx] = projInfo
+    solInfo.updateProjectDict()
+    return projectPaths
+
+
+def loadSolution(stateFilename, solutionFilenames, changedFiles, jobs = 1, keepDocuments = True): # return SolutionFileInfo or None when a full scan is needed
+    projects = readState(stateFilename, solutionFilenames)
+    if projects == None: return None
+    solInfo = vssol.SolutionFileInfo()
+    solInfo.solutionFilePath = solutionFilenames[0]
+    solInfo.solutionFilePaths = list(solutionFilenames)
+    solInfo.projectList = projects
+    solInfo.updateProjectDict()
+    solInfo.resetVersionChanges()
+    projectPaths = refreshProjects(solInfo, changedFiles, jobs, keepDocuments)
+    print("State", stateFilename, ":", len(projectPaths), "of", len(projects), "projects parsed again")
+    return solInfo
+
+
+def readChangedFiles(args): # return list of filenames; "-" reads one filename per line from stdin
+    filenames = list()
+    for arg in args:
+        if arg == "-":
+            filenames.extend(line.strip() for line in sys.stdin if line.strip())
+        else:
+            filenames.append(arg)
+    return filenames
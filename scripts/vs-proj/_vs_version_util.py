@@ -1,63 +1,88 @@
 import re
-import copy
+import functools
 
 
 #^(?P<major>0|[1-9]\d*)\.(?P<minor>0|[1-9]\d*)\.(?P<patch>0|[1-9]\d*)(?:-(?P<prerelease>(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*))*))?(?:\+(?P<buildmetadata>[0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?$
 
+TAIL_NUMBER_RE = re.compile(r"(\d+)(?!.*\d)")
+# bounds of a version range; anything else, like a $version$ token, leaves the text opaque
+RANGE_BOUND_RE = re.compile(r"^\d+(\.\d+)*(-[0-9A-Za-z.-]+)?$")
+FLOATING_VERSION_RE = re.compile(r"^(\*|\d+(\.\d+)*(\.\*)?)(-[0-9A-Za-z.-]*\*?)?$")
+
+
 class SemVersion:
-    #core = None # list()
+    #core = None # tuple()
     #preRelease = None
-    def __init__(self):
-        self.core = None
-        self.preRelease = None # list()
+    #key = None # precomputed comparison key
+    #frozen = True # parsed versions are immutable, clone() returns a mutable copy
+    __slots__ = ("core", "preRelease", "key", "frozen")
 
     def __init__(self, versionStr, coreLen = 0):
+        self.frozen = False
         self.setVersionString(versionStr)
+        self.frozen = True
 
     def clone(self):
-        newVer = copy.deepcopy(self)
+        newVer = SemVersion.__new__(SemVersion)
+        newVer.core = self.core
+        newVer.preRelease = self.preRelease
+        newVer.key = self.key
+        newVer.frozen = False
         return newVer
 
+    def freeze(self):
+        self.frozen = True
+        return self
+
+    def snapshot(self): # return an immutable version equal to self, without copying when self already is
+        if self.frozen: return self
+        return self.clone().freeze()
+
+    def checkMutable(self):
+        if self.frozen: raise TypeError("SemVersion is immutable, use clone() before changing it")
+
+    def updateKey(self):
+        # trailing zeros do not count: 1.0 == 1.0.0, and a release sorts after its prereleases
+        core = self.core
+        n = len(core)
+        while n > 0 and core[n - 1] == 0: n -= 1
+        if self.preRelease: self.key = (core[:n], 0, self.preRelease)
+        else: self.key = (core[:n], 1, "")
+
     def setVersionString(self, versionStr, coreLen = 0):
-        if not versionStr: 
-            self.core = [1]
+        self.checkMutable()
+        if not versionStr:
+            self.core = (1,)
             self.preRelease = None
+            self.updateKey()
             return
         vers = versionStr.split('-')
         if len(vers) >= 2:
             self.preRelease = vers[1]
         else:
             self.preRelease = None
-        vers = vers[0].split('.')
-        self.core = list()
-        for v in vers:
-            self.core.append(int(v))
+        self.core = tuple(int(v) for v in vers[0].split('.'))
+        self.updateKey()
 
     def toString(self, coreLen = 0, embPresig = True):
-        verStr = ""
         if coreLen == 0: coreLen = len(self.core)
-        minlen = min(len(self.core), coreLen)
-        idx = 0
-        for v in range(0, minlen):
-            if idx > 0: verStr = verStr + '.'
-            verStr = verStr + str(self.core[v])
-            idx += 1
-        if idx < coreLen:
-            for i in range(idx, coreLen):
-                verStr = verStr + ".0"
+        parts = [str(v) for v in self.core[:coreLen]]
+        if len(parts) < coreLen: parts.extend(["0"] * (coreLen - len(parts)))
+        verStr = ".".join(parts)
         if embPresig and self.preRelease:
-            verStr = verStr + '-' + self.preRelease    
+            verStr = verStr + '-' + self.preRelease
         return verStr
 
     def addVersion(self, incVer):
-        l1 = len(self.core)
+        self.checkMutable()
         l2 = len(incVer.core)
-        for i in range(0, l1):
-            if i < l2: self.core[i] += incVer.core[i]
+        self.core = tuple(v + incVer.core[i] if i < l2 else v for i, v in enumerate(self.core))
+        self.updateKey()
 
     def incTailVersion(self, presig = "", inc = 1):
+        self.checkMutable()
         if self.preRelease and (not presig or (self.preRelease >= presig)):
-            d = re.findall(r"(\d+)(?!.*\d)", self.preRelease)
+            d = TAIL_NUMBER_RE.findall(self.preRelease)
             if d:
                 ss = self.preRelease[: len(self.preRelease) - len(d)]
                 ss = ss + str(int(d[0]) + inc)
@@ -65,10 +90,129 @@ class SemVersion:
                 ss = self.preRelease + str(1 + inc)
             self.preRelease = ss
         else:
-            v = self.core[len(self.core) - 1]
-            self.core[len(self.core) - 1] = v + inc
+            self.core = self.core[:-1] + (self.core[-1] + inc,)
             if presig:
                 self.preRelease = presig + "1"
+        self.updateKey()
+
+    def __eq__(self, other):
+        if not isinstance(other, SemVersion): return NotImplemented
+        return self.key == other.key
+
+    def __ne__(self, other):
+        if not isinstance(other, SemVersion): return NotImplemented
+        return self.key != other.key
+
+    def __lt__(self, other):
+        if not isinstance(other, SemVersion): return NotImplemented
+        return self.key < other.key
+
+    def __le__(self, other):
+        if not isinstance(other, SemVersion): return NotImplemented
+        return self.key <= other.key
+
+    def __gt__(self, other):
+        if not isinstance(other, SemVersion): return NotImplemented
+        return self.key > other.key
+
+    def __ge__(self, other):
+        if not isinstance(other, SemVersion): return NotImplemented
+        return self.key >= other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return "SemVersion('" + self.toString() + "')"
+
+
+@functools.lru_cache(maxsize=4096)
+def internVersion(versionStr): # return a shared, immutable SemVersion for versionStr
+    return SemVersion(versionStr)
+
+
+class VersionRange:
+    # NuGet range syntax: [1.0,2.0) (,2.0] [1.0] (1.0,) and floating versions 1.* 1.2.* * 1.0.0-* 1.0.0-beta*
+    #text = None # range as written
+    #minVersion = None # SemVersion or None when unbounded
+    #minInclusive = True
+    #maxVersion = None # SemVersion or None when unbounded
+    #maxInclusive = False
+    #floatCore = None # tuple() : fixed leading numbers of a floating version, None for an interval
+    #floatPreRelease = None # prerelease prefix a floating version admits, None when it admits releases only
+    __slots__ = ("text", "minVersion", "minInclusive", "maxVersion", "maxInclusive", "floatCore", "floatPreRelease")
+
+    def __init__(self, text):
+        self.text = text
+        self.minVersion = None
+        self.minInclusive = True
+        self.maxVersion = None
+        self.maxInclusive = False
+        self.floatCore = None
+        self.floatPreRelease = None
+
+    def contains(self, version):
+        if version == None: return False
+        if self.floatCore != None: return self.containsFloating(version)
+        if self.minVersion != None:
+            result = VersionCompare(version, self.minVersion)
+            if result < 0 or (result == 0 and not self.minInclusive): return False
+        if self.maxVersion != None:
+            result = VersionCompare(version, self.maxVersion)
+            if result > 0 or (result == 0 and not self.maxInclusive): return False
+        return True
+
+    def containsFloating(self, version):
+        core = version.core + (0,) * (len(self.floatCore) - len(version.core))
+        if core[:len(self.floatCore)] != self.floatCore: return False
+        if not version.preRelease: return True
+        return self.floatPreRelease != None and version.preRelease.startswith(self.floatPreRelease)
+
+    def getBaseVersion(self): # return the lowest version the range names, or None when it is unbounded below
+        return self.minVersion
+
+
+@functools.lru_cache(maxsize=4096)
+def parseVersionRange(text): # return a shared VersionRange, or None when text is a plain version or cannot be parsed
+    if not text: return None
+    text = text.strip()
+    versionRange = VersionRange(text)
+    if text[:1] in "[(" and text[-1:] in "])":
+        inner = text[1:-1]
+        bounds = [part.strip() for part in inner.split(",", 1)]
+        if not all(RANGE_BOUND_RE.match(bound) for bound in bounds if bound): return None
+        if not ("," in inner):
+            # [1.0] is the only form without a comma
+            if not bounds[0]: return None
+            versionRange.minVersion = versionRange.maxVersion = internVersion(inner.strip())
+            versionRange.maxInclusive = True
+            return versionRange
+        low, high = [part.strip() for part in inner.split(",", 1)]
+        if low: versionRange.minVersion = internVersion(low)
+        if high: versionRange.maxVersion = internVersion(high)
+        versionRange.minInclusive = text[0] == "["
+        versionRange.maxInclusive = text[-1] == "]"
+        return versionRange
+    if "*" in text and FLOATING_VERSION_RE.match(text):
+        corePart, sep, prePart = text.partition("-")
+        numbers = list()
+        for v in corePart.split("."):
+            if v == "*": break
+            numbers.append(int(v))
+        versionRange.floatCore = tuple(numbers)
+        if sep: versionRange.floatPreRelease = prePart.split("*", 1)[0]
+        base = ".".join(str(v) for v in numbers + [0] * (3 - len(numbers)))
+        if versionRange.floatPreRelease: base = base + "-" + versionRange.floatPreRelease
+        versionRange.minVersion = internVersion(base)
+        return versionRange
+    return None
+
+
+def getNextVersion(version, presig = ""): # return the version an automatic bump gives to a project at version
+    if version == None: return SemVersion("1.0.1")
+    newVersion = version.clone()
+    newVersion.incTailVersion(presig)
+    return newVersion
 
 
 def VersionCompare(version, baseVersion):
@@ -76,22 +220,6 @@ def VersionCompare(version, baseVersion):
     if not version: return -1
     if not baseVersion: return 1
 
-    l1 = len(version.core)
-    l2 = len(baseVersion.core)
-    l3 = max(l1, l2)
-    for i in range(0, l3):
-        if i < l1: v1 = version.core[i]
-        else: v1 = 0        
-        if i < l2: v2 = baseVersion.core[i]
-        else: v2 = 0
-        if v1 > v2: return 1
-        elif v1 < v2: return -1
-
-    if version.preRelease:
-        if not baseVersion.preRelease: return -1
-        else:
-            if version.preRelease > baseVersion.preRelease: return 1
-            elif version.preRelease < baseVersion.preRelease: return -1
-    elif baseVersion.preRelease: return 1
-        
+    if version.key > baseVersion.key: return 1
+    elif version.key < baseVersion.key: return -1
     return 0
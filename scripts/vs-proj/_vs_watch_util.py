@@ -0,0 +1,98 @@
+import sys
+import os
+import _vs_solution_util as vssol
+import _vs_cache_util as vscache
+import _vs_props_util as vsprops
+import _vs_dir_util as vsdir
+
+
+def getStatStamp(filename): # return (size, mtime_ns) or None when the file does not exist
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+class SolutionWatcher:
+    #solInfo = None
+    #slnStamps = None # list() : stamp of each solution file
+    #projStamps = None # dict() : project path -> list of (filename, stamp)
+    def __init__(self, solutionFilenames, jobs = 1, cache = None):
+        if isinstance(solutionFilenames, str): solutionFilenames = [solutionFilenames]
+        self.solutionFilenames = list(solutionFilenames)
+        self.jobs = jobs
+        self.cache = cache
+        self.solInfo = None
+        self.slnStamps = None
+        self.projStamps = dict()
+
+    def parseProjects(self, projectFilenames):
+        if self.cache != None:
+            return self.cache.getProjectInfoList(projectFilenames, lambda filenames: vssol.getProjectInfoList(filenames, self.jobs))
+        return vssol.getProjectInfoList(projectFilenames, self.jobs)
+
+    def getProjectStamps(self, projInfo):
+        return [(filename, getStatStamp(filename)) for filename in vscache.getProjectDependFiles(projInfo)]
+
+    def isProjectChanged(self, projInfo):
+        stamps = self.projStamps.get(projInfo.projRefInfo.projectPath)
+        if stamps == None: return True
+        for filename, stamp in stamps:
+            if getStatStamp(filename) != stamp: return True
+        return False
+
+    def getSolutionStamps(self):
+        return [getStatStamp(filename) for filename in self.solutionFilenames]
+
+    def load(self):
+        self.slnStamps = self.getSolutionStamps()
+        vsprops.clearCache()
+        vsdir.clearCache()
+        self.solInfo = vssol.getWorkspaceInfo(self.solutionFilenames, self.jobs, self.cache)
+        self.projStamps = dict()
+        for proj in self.solInfo.projectList:
+            self.projStamps[proj.projRefInfo.projectPath] = self.getProjectStamps(proj)
+        return self.solInfo
+
+    def poll(self): # re-parse the changed files only; return list of re-parsed project paths
+        if self.solInfo == None:
+            self.load()
+            return [proj.projRefInfo.projectPath for proj in self.solInfo.projectList]
+
+        oldProjects = dict()
+        for proj in self.solInfo.projectList:
+            oldProjects[proj.projRefInfo.projectPath] = proj
+
+        slnStamps = self.getSolutionStamps()
+        if slnStamps != self.slnStamps:
+            self.slnStamps = slnStamps
+            projectPaths = [os.path.abspath(filename) for filename in vssol.getWorkspaceProjectFilenames(self.solutionFilenames)]
+        else:
+            projectPaths = list(oldProjects.keys())
+
+        changedPaths = list()
+        for path in projectPaths:
+            proj = oldProjects.get(path)
+            if proj == None or self.isProjectChanged(proj): changedPaths.append(path)
+        if not changedPaths and projectPaths == list(oldProjects.keys()): return changedPaths
+        # a changed project may have gained or lost a Module.nuspec, an AssemblyInfo.cs or a props file
+        vsprops.clearCache()
+        vsdir.clearCache()
+
+        newProjects = dict()
+        for proj in self.parseProjects(changedPaths):
+            newProjects[proj.projRefInfo.projectPath] = proj
+            self.projStamps[proj.projRefInfo.projectPath] = self.getProjectStamps(proj)
+
+        projectList = list()
+        for path in projectPaths:
+            proj = newProjects.get(path)
+            if proj == None: proj = oldProjects[path]
+            projectList.append(proj)
+        removedPaths = set(oldProjects.keys()) - set(projectPaths)
+        for path in removedPaths: self.projStamps.pop(path, None)
+
+        self.solInfo.projectList = projectList
+        self.solInfo.updateProjectDict()
+        return changedPaths
@@ -0,0 +1,101 @@
+import sys
+import os
+import shutil
+import tempfile
+import _vs_profile_util as vsprof
+
+
+class FileWriteBatch:
+    #files = None # dict() : filename -> [new bytes, original bytes]
+    def __init__(self):
+        self.files = dict()
+        self.order = list()
+
+    def getPending(self, filename): # return bytes staged for filename or None
+        entry = self.files.get(os.path.abspath(filename))
+        if entry == None: return None
+        return entry[0]
+
+    def add(self, filename, data, original = None):
+        filename = os.path.abspath(filename)
+        entry = self.files.get(filename)
+        if entry != None:
+            entry[0] = data
+            return
+        if original == None:
+            with open(filename, "rb") as f:
+                original = f.read()
+        self.files[filename] = [data, original]
+        self.order.append(filename)
+
+    def writeTempFile(self, filename):
+        dirname, basename = os.path.split(filename)
+        fd, tmpPath = tempfile.mkstemp(prefix="." + basename + ".", suffix=".tmp", dir=dirname)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.files[filename][0])
+            try:
+                shutil.copymode(filename, tmpPath)
+            except OSError:
+                pass
+        except BaseException:
+            removeFile(tmpPath)
+            raise
+        return tmpPath
+
+    def commit(self, jobs = 8): # write every staged file or none of them; return list of the written filenames
+        filenames = [filename for filename in self.order if self.files[filename][0] != self.files[filename][1]]
+        if not filenames: return filenames
+
+        import concurrent.futures
+        tmpPaths = dict()
+        errors = list()
+        if jobs == None or jobs <= 0: jobs = os.cpu_count() or 1
+        jobs = min(jobs, len(filenames))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = dict()
+            for filename in filenames:
+                futures[executor.submit(self.writeTempFile, filename)] = filename
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    tmpPaths[futures[future]] = future.result()
+                except Exception as e:
+                    errors.append(e)
+        if errors:
+            for tmpPath in tmpPaths.values(): removeFile(tmpPath)
+            raise errors[0]
+
+        replaced = list()
+        try:
+            for filename in filenames:
+                os.replace(tmpPaths[filename], filename)
+                del tmpPaths[filename]
+                replaced.append(filename)
+        except BaseException:
+            for tmpPath in tmpPaths.values(): removeFile(tmpPath)
+            self.rollback(replaced)
+            raise
+
+        vsprof.addCount("filesWritten", len(filenames))
+        vsprof.addCount("bytesWritten", sum(len(self.files[filename][0]) for filename in filenames))
+        self.files = dict()
+        self.order = list()
+        return filenames
+
+    def rollback(self, filenames):
+        for filename in filenames:
+            try:
+                dirname, basename = os.path.split(filename)
+                fd, tmpPath = tempfile.mkstemp(prefix="." + basename + ".", suffix=".bak", dir=dirname)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(self.files[filename][1])
+                os.replace(tmpPath, filename)
+            except OSError as e:
+                print("> Cannot restore", filename, e)
+
+
+def removeFile(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
@@ -0,0 +1,193 @@
+import sys
+import os
+import re
+import xml.parsers.expat as expat
+import xml.etree.ElementTree as etree
+import _vs_profile_util as vsprof
+
+
+START_TAG_RE = re.compile(rb"<([^\s/>]+)((?:\s+[^\s=/>]+\s*=\s*(?:\"[^\"]*\"|'[^']*'))*)\s*(/?)>")
+ATTR_RE = re.compile(rb"([^\s=/>]+)(\s*=\s*)(?:\"([^\"]*)\"|'([^']*)')")
+INDENT_RE = re.compile(rb"[ \t]*")
+
+
+class XmlDocument:
+    #data = None # bytes
+    #root = None
+    #spans = None # dict() : element -> (start of start tag, end index reported by expat)
+    #stamp = None # (size, mtime_ns) of the file the data was read from
+    def __init__(self, data, root, spans, stamp = None):
+        self.data = data
+        self.root = root
+        self.spans = spans
+        self.stamp = stamp
+
+    def getStartTag(self, elem): # return match of the start tag or None
+        span = self.spans.get(elem)
+        if span == None: return None
+        return START_TAG_RE.match(self.data, span[0])
+
+    def getTextAnchor(self, elem): # anchor for replacing the text of a leaf element
+        m = self.getStartTag(elem)
+        if m == None: return None
+        if m.group(3):
+            return ("empty", m.end(2), m.end(), m.group(1))
+        return ("text", m.end(), self.spans[elem][1])
+
+    def getAttrAnchor(self, elem, attrName): # anchor for replacing or adding an attribute value
+        m = self.getStartTag(elem)
+        if m == None: return None
+        name = attrName.encode("utf-8")
+        for am in ATTR_RE.finditer(self.data, m.start(2), m.end(2)):
+            if am.group(1) == name:
+                if am.group(3) != None: return ("attr", am.start(3), am.end(3))
+                return ("attr", am.start(4), am.end(4))
+        if m.group(3): pos = m.end() - 2
+        else: pos = m.end() - 1
+        while pos > m.end(2) and self.data[pos - 1:pos] in (b" ", b"\t", b"\r", b"\n"): pos -= 1
+        return ("addattr", pos, name)
+
+    def getLineIndent(self, pos): # return (line start, indent) when only blanks precede pos on its line
+        lineStart = self.data.rfind(b"\n", 0, pos) + 1
+        if INDENT_RE.match(self.data, lineStart).end() != pos: return None, None
+        return lineStart, self.data[lineStart:pos]
+
+    def getNewline(self):
+        if b"\r\n" in self.data: return b"\r\n"
+        return b"\n"
+
+    def getChildAnchor(self, parent): # anchor for appending child elements to parent
+        m = self.getStartTag(parent)
+        if m == None or m.group(3): return None
+        endPos = self.spans[parent][1]
+        lineStart, indent = self.getLineIndent(endPos)
+        if lineStart == None:
+            return ("child", endPos, b"", b"")
+        childIndent = None
+        if len(parent):
+            childIndent = self.getLineIndent(self.spans[parent[-1]][0])[1]
+        if childIndent == None: childIndent = indent + b"  "
+        return ("child", lineStart, childIndent, self.getNewline())
+
+
+def readXmlFile(filename): # return (bytes, (size, mtime_ns))
+    with open(filename, "rb") as f:
+        st = os.fstat(f.fileno())
+        data = f.read()
+    vsprof.addCount("xmlFilesRead")
+    vsprof.addCount("xmlBytesRead", len(data))
+    return data, (st.st_size, st.st_mtime_ns)
+
+
+def parseXmlFile(filename): # return XmlDocument
+    data, stamp = readXmlFile(filename)
+    return parseXmlBytes(data, stamp)
+
+
+def parseXmlBytes(data, stamp = None): # return XmlDocument
+    builder = etree.TreeBuilder()
+    spans = dict()
+    stack = list()
+    parser = expat.ParserCreate(namespace_separator="}")
+    parser.buffer_text = True
+
+    def fixName(name):
+        if "}" in name: return "{" + name
+        return name
+
+    def startElement(name, attrs):
+        attrib = dict()
+        for k, v in attrs.items(): attrib[fixName(k)] = v
+        stack.append(parser.CurrentByteIndex)
+        builder.start(fixName(name), attrib)
+
+    def endElement(name):
+        elem = builder.end(fixName(name))
+        spans[elem] = (stack.pop(), parser.CurrentByteIndex)
+
+    parser.StartElementHandler = startElement
+    parser.EndElementHandler = endElement
+    parser.CharacterDataHandler = builder.data
+    try:
+        parser.Parse(data, True)
+    except expat.ExpatError as e:
+        raise etree.ParseError(str(e))
+
+    return XmlDocument(data, builder.close(), spans, stamp)
+
+
+def escapeValue(value): # same as xml.sax.saxutils.escape with &quot;, which would pull in urllib on import
+    return value.replace("&", "&amp;").replace(">", "&gt;").replace("<", "&lt;").replace("\"", "&quot;")
+
+
+def renderEdit(anchor, value, tagName = None):
+    kind = anchor[0]
+    v = escapeValue(value).encode("utf-8")
+    if kind == "text" or kind == "attr":
+        return v
+    elif kind == "empty":
+        return b">" + v + b"</" + anchor[3] + b">"
+    elif kind == "addattr":
+        return b" " + anchor[2] + b"=\"" + v + b"\""
+    elif kind == "child":
+        name = tagName.encode("utf-8")
+        return anchor[2] + b"<" + name + b">" + v + b"</" + name + b">" + anchor[3]
+    return None
+
+
+def renderGroup(anchor, groupName, children): # children: list of (tagName, value)
+    name = groupName.encode("utf-8")
+    childIndent = anchor[2] + b"  " if anchor[3] else b""
+    childAnchor = ("child", anchor[1], childIndent, anchor[3])
+    chunks = [anchor[2] + b"<" + name + b">" + anchor[3]]
+    for tagName, value in children:
+        chunks.append(renderEdit(childAnchor, value, tagName))
+    chunks.append(anchor[2] + b"</" + name + b">" + anchor[3])
+    return b"".join(chunks)
+
+
+def getEditRange(anchor):
+    kind = anchor[0]
+    if kind == "text" or kind == "attr" or kind == "empty": return anchor[1], anchor[2]
+    return anchor[1], anchor[1]
+
+
+def makeEdit(anchor, value, tagName = None): # return (start, end, bytes)
+    start, end = getEditRange(anchor)
+    return (start, end, renderEdit(anchor, value, tagName))
+
+
+def spliceEdits(data, edits): # edits: list of (start, end, bytes); return new bytes
+    # edits at the same insertion point keep their given order
+    edits = sorted(enumerate(edits), key=lambda e: (e[1][0], e[1][1], e[0]))
+    chunks = list()
+    pos = 0
+    for _, (start, end, newBytes) in edits:
+        if start < pos: continue
+        chunks.append(data[pos:start])
+        chunks.append(newBytes)
+        pos = end
+    chunks.append(data[pos:])
+    return b"".join(chunks)
+
+
+def getFileStamp(filename):
+    st = os.stat(filename)
+    return (st.st_size, st.st_mtime_ns)
+
+
+def readPatchData(filename, stamp, data = None): # return the file bytes when the file still matches stamp, else None
+    try:
+        if stamp == None or getFileStamp(filename) != stamp: return None
+        if data != None: return data
+        with open(filename, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) != stamp[0]: return None
+    return data
+
+
+def writeFileBytes(filename, data):
+    with open(filename, "wb") as f:
+        f.write(data)